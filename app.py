@@ -2,46 +2,254 @@ import pandas as pd
 import plotly.express as px
 from dash import Dash, dcc, html, Input, Output, callback,no_update,State,dash_table,html,ctx
 from dash.dependencies import State, ALL, MATCH
-from flask import Flask
+from dash._callback import GLOBAL_CALLBACK_MAP
+from flask import Flask, jsonify
 import calendar
 import plotly.graph_objects as go
 from statsmodels.nonparametric.smoothers_lowess import lowess
-from collections import Counter
+from functools import lru_cache
 import numpy as np
 import datetime
 import os
-print(f"PID: {os.getpid()}")
-cols = [
-    'Orthophosphate, reactive as P (mg/l)', 'Temperature of Water (°C)',
-    'Ammoniacal Nitrogen as N (mg/l)', 'Phosphorus, Total as P (mg/l)',
-    'Nitrogen, Total Oxidised as N (mg/l)', 'Nitrate as N (mg/l)',
-    'Nitrite as N (mg/l)', 'Nitrogen, Total as N (mg/l)',
-    'Alkalinity to pH 4.5 as CaCO3 (mg/l)', 'pH (phunits)',
-    'Oxygen, Dissolved, % Saturation (%)', 'Oxygen, Dissolved as O2 (mg/l)',
-    'BOD : 5 Day ATU (mg/l)', 'Solids, Suspended at 105 C (mg/l)'
-]
-
-
-# Load data
-df = pd.read_parquet("mappable.parquet")
-# Split comma-separated test types and get unique trimmed entries
-# Flatten and split test types
-split_test_types = df['Test_Type'].dropna().str.lower().str.split(',').explode()
-split_test_types = split_test_types.str.strip()
-
-# Count and sort by frequency
-type_counts = Counter(split_test_types)
-test_types_x = [t for t, _ in type_counts.most_common()]
-
-
-# Aggregate location info
-location_info = df.groupby("Location_ID").agg({
-    "Location_Name": "first",
-    "Longitude": "first",
-    "Latitude": "first",
-    "Sample_Count":"first",
-    "Test_Type": lambda x: ", ".join(sorted(set(x.dropna())))
-}).reset_index()
+import time
+from dataset import MANIFEST, SERVING_DIR, SOURCE_PATH, ParquetSamples, cols, compute_colour_range, load_tables
+from spatial import LocationIndex
+from downsample import downsample, relayout_x_range
+from encoding import pack_figure
+from figure_cache import FigureCache
+from shared_cache import DiskCache
+from instrumentation import CallbackTimings
+from hot_reload import DatasetReloader
+from metrics import Registry, family, histogram_samples, resident_memory_bytes
+
+# Interaction tracing (callback inputs, clicks) printed to stdout; off unless
+# DEBUG_LOG=1, so production doesn't pay for the I/O on every interaction
+DEBUG_LOG = os.environ.get("DEBUG_LOG") == "1"
+
+
+def debug(*args):
+    if DEBUG_LOG:
+        print(*args)
+
+
+debug(f"PID: {os.getpid()}")
+
+# Per-callback timing histograms, served at /callback-timings
+timings = CallbackTimings()
+# Prometheus metrics at /metrics. Under gunicorn, point METRICS_DIR at a
+# directory shared by the workers so a scrape of any worker covers all of them
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+metrics = Registry(METRICS_DIR)
+
+
+@timings.data_access
+def get_location_rows(location_id):
+    # All rows for one location, in Date order, without scanning the whole sample table
+    return samples.location_rows(location_id)
+
+
+@timings.data_access
+def get_locations_rows(location_ids, columns=None):
+    # Rows of several locations in one batched read, grouped by location
+    return samples.locations_rows(location_ids, columns)
+
+
+def date_window(rows, start_date=None, end_date=None):
+    # Rows of one location between two dates (inclusive); rows are Date-sorted,
+    # so this is two binary searches and a slice rather than a full comparison
+    dates = rows['Date'].to_numpy()
+    start = np.searchsorted(dates, np.datetime64(pd.to_datetime(start_date)), side='left') if start_date else 0
+    end = np.searchsorted(dates, np.datetime64(pd.to_datetime(end_date)), side='right') if end_date else len(dates)
+    return rows.iloc[start:end]
+
+
+def test_type_bits(selected_test_types):
+    # Bitmask for a dropdown selection; a row matches if (row_bits & mask) != 0
+    return sum(1 << test_type_index[t] for t in set(selected_test_types or []) if t in test_type_index)
+
+
+# Source sample table; any parquet file with the mappable.parquet schema
+# (e.g. one written by synthetic.py)
+DATASET_PATH = os.environ.get("DATASET_PATH", SOURCE_PATH)
+# Read the sample table on demand (column projection / row-group pruning)
+# instead of holding it all in memory; needs `python dataset.py build`, and
+# reads the Year-partitioned copy when built with --partitioned
+LAZY_SAMPLES = os.environ.get("LAZY_SAMPLES") == "1"
+# Memory-map the Arrow copy of the sample table so gunicorn workers share one
+# physical copy of the numeric columns; needs `python dataset.py build`
+MMAP_SAMPLES = os.environ.get("MMAP_SAMPLES") == "1"
+# Memory budget for rendered figures shared between users (0 disables it)
+FIGURE_CACHE_MB = float(os.environ.get("FIGURE_CACHE_MB", "64"))
+# Send dates and float arrays in figures as base64 typed arrays (float32, and
+# epoch milliseconds for dates) instead of JSON lists
+BINARY_FIGURES = os.environ.get("BINARY_FIGURES") == "1"
+# Optional SQLite file shared by all workers on the host for expensive results
+# (figures, LOWESS curves, category tables); unset keeps caching per process
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH") or None
+SHARED_CACHE_MB = float(os.environ.get("SHARED_CACHE_MB", "256"))
+SHARED_CACHE_TTL = float(os.environ.get("SHARED_CACHE_TTL", "86400"))
+# Reload the dataset in place when DATASET_PATH or the serving manifest
+# changes, checking every this many seconds (0 disables the watcher)
+DATASET_POLL_SECONDS = float(os.environ.get("DATASET_POLL_SECONDS", "0"))
+# Secret for POST /admin/reload; unset disables manual reloads
+RELOAD_TOKEN = os.environ.get("RELOAD_TOKEN") or None
+
+# Load data: precomputed serving tables (see `python dataset.py build`) when
+# they are current, otherwise derived from DATASET_PATH at import
+load_started = time.perf_counter()
+tables, dataset_version = load_tables(DATASET_PATH, lazy=LAZY_SAMPLES, mmap=MMAP_SAMPLES)
+dataset_load_seconds = time.perf_counter() - load_started
+print(f"Dataset version: {dataset_version}")
+
+# Cross-worker tier and in-process figure cache; entries from another dataset
+# version are never served
+shared_cache = DiskCache(
+    SHARED_CACHE_PATH, int(SHARED_CACHE_MB * 1024 * 1024), SHARED_CACHE_TTL, version=dataset_version
+)
+figure_cache = FigureCache(
+    int(FIGURE_CACHE_MB * 1024 * 1024), version=dataset_version, shared=shared_cache,
+    encode=pack_figure if BINARY_FIGURES else None,
+)
+
+
+def dataset_state(tables):
+    # Everything the callbacks read from the dataset, derived from one set of
+    # serving tables. Installed as module globals, and replaced as a whole
+    # when the dataset is reloaded (see swap_dataset).
+    location_info = tables["location_info"]
+    test_types_x = list(tables["test_types"]["Test_Type"])
+    map_cube = {
+        mode: (tables[f"map_cube_{mode}_sum"], tables[f"map_cube_{mode}_count"])
+        for mode in ("Year", "Month")
+    }
+    return {
+        # Sample table, sorted by Location_ID then Date, with a Test_Type_bits column
+        "samples": tables["samples"],
+        # Test types ordered by frequency
+        "test_types_x": test_types_x,
+        "test_type_index": {t: i for i, t in enumerate(test_types_x)},
+        # Aggregate location info
+        "location_info": location_info,
+        "location_tree": LocationIndex(location_info),
+        # Per-location test types and shape clusters for the category tables
+        "location_test_types": tables["location_test_types"],
+        "location_clusters": tables["location_clusters"],
+        # Precomputed (period, location, test type) aggregates for the main map
+        "map_cube": map_cube,
+        "colour_ranges": tables["colour_ranges"],
+        # Slider positions for each mode
+        "period_values": {
+            mode: sorted(int(v) for v in map_cube[mode][1].index.unique(level=mode).dropna())
+            for mode in ("Year", "Month")
+        },
+    }
+
+
+# samples, test_types_x, test_type_index, location_info, location_tree,
+# location_test_types, location_clusters, map_cube, colour_ranges, period_values
+globals().update(dataset_state(tables))
+
+
+@timings.data_access
+def map_location_means(mode, time_value, col, selected_test_types, min_sample_count):
+    # Mean of the unflagged values per location for one map frame, read from the cube
+    sums, counts = map_cube[mode]
+    try:
+        sums = sums.loc[time_value, col]
+        counts = counts.loc[time_value, col]
+    except KeyError:
+        return pd.DataFrame(columns=["Location_ID", col])
+
+    keep = counts.index.get_level_values("Sample_Count") >= min_sample_count
+    if selected_test_types:
+        keep &= (counts.index.get_level_values("Test_Type_bits") & test_type_bits(selected_test_types)) != 0
+
+    sums = sums[keep].groupby(level="Location_ID", observed=True).sum()
+    counts = counts[keep].groupby(level="Location_ID", observed=True).sum()
+    return (sums / counts)[counts > 0].rename(col).reset_index()
+
+
+@timings.data_access
+@lru_cache(maxsize=128)
+def colour_range(col, test_types):
+    # Colour scale bounds; independent of the slider position, so cached per
+    # (parameter, test-type tuple). Unfiltered ranges come precomputed.
+    if not test_types and col in colour_ranges.index:
+        return tuple(colour_ranges.loc[col, ["min", "max"]])
+    columns = [col, f"{col}_flagged", "Test_Type_bits"]
+    bits = test_type_bits(test_types)
+    if isinstance(samples, ParquetSamples):
+        # Lazy samples: read only the unflagged rows of the matching test-type
+        # combinations (every combination present is a key of the map cube)
+        present = map_cube["Year"][1].index.unique(level="Test_Type_bits")
+        matching = [int(b) for b in present if not bits or b & bits]
+        frame = samples.read(columns, filters=[(f"{col}_flagged", "==", False), ("Test_Type_bits", "in", matching)])
+    else:
+        frame = samples.load(columns)
+    return compute_colour_range(frame, col, bits)
+
+
+# Prewarm the colour scale for every parameter with no test-type filter
+for col in cols:
+    colour_range(col, ())
+
+# Frame duration for in-browser map animation (ms)
+ANIMATION_FRAME_MS = 800
+
+# Series longer than this are binned before LOWESS (0 = always use every point)
+LOWESS_MAX_POINTS = 5000
+# Most points sent per raw/LOWESS trace in the time-series graphs (LTTB)
+RAW_TRACE_MAX_POINTS = 1000
+ORDINAL_EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def dates_to_ordinals(dates):
+    # Vectorised datetime.toordinal()
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64) + ORDINAL_EPOCH
+
+
+def ordinals_to_dates(ordinals):
+    # Vectorised datetime.date.fromordinal()
+    days = np.asarray(ordinals).astype(np.int64) - ORDINAL_EPOCH
+    return pd.to_datetime(days.astype("datetime64[D]").astype("datetime64[ns]"))
+
+
+def smooth(y, x):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if LOWESS_MAX_POINTS and len(x) > LOWESS_MAX_POINTS:
+        # Average into equal-width x bins and smooth the bin means instead
+        edges = np.linspace(x.min(), x.max(), LOWESS_MAX_POINTS + 1)
+        bins = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, LOWESS_MAX_POINTS - 1)
+        counts = np.bincount(bins, minlength=LOWESS_MAX_POINTS)
+        keep = counts > 0
+        x = np.bincount(bins, x, LOWESS_MAX_POINTS)[keep] / counts[keep]
+        y = np.bincount(bins, y, LOWESS_MAX_POINTS)[keep] / counts[keep]
+    return lowess(y, x, frac=0.5)
+
+
+@lru_cache(maxsize=512)
+@shared_cache.memoize('smoothed_series')
+def smoothed_series(location_id, metric, view, remove_anomalies=False, start_date=None, end_date=None):
+    # LOWESS curve for one location/metric. 'All' smooths the raw samples and
+    # returns Date/Smoothed; 'Yearly' and 'Monthly' smooth the period averages and
+    # return Year|Month/metric/Smoothed. Cached, so callers must not modify it.
+    rows = date_window(get_location_rows(location_id), start_date, end_date)
+    flagged_col = f"{metric}_flagged"
+    if remove_anomalies and flagged_col in rows.columns:
+        rows = rows[~rows[flagged_col]]
+    rows = rows.dropna(subset=[metric])
+
+    if view == 'All':
+        if rows.empty:
+            return pd.DataFrame(columns=['Date', 'Smoothed'])
+        smoothed = smooth(rows[metric], dates_to_ordinals(rows['Date']))
+        return pd.DataFrame({'Date': ordinals_to_dates(smoothed[:, 0]), 'Smoothed': smoothed[:, 1]})
+
+    period = 'Year' if view == 'Yearly' else 'Month'
+    averages = rows.groupby(period)[metric].mean().reset_index()
+    averages['Smoothed'] = smooth(averages[metric], averages[period].astype(np.int64))[:, 1] if len(averages) else []
+    return averages
 
 # Flask server
 server = Flask(__name__)
@@ -49,6 +257,12 @@ server = Flask(__name__)
 # Dash app inside Flask
 app = Dash(__name__, server=server, url_base_pathname="/", suppress_callback_exceptions=True)
 
+
+
+@server.route("/cache-stats")
+def cache_stats():
+    return jsonify({**figure_cache.stats(), "shared": shared_cache.stats()})
+
 # Layout
 app.index_string = open("templates/index.html", "r").read()
 
@@ -138,10 +352,10 @@ def render_main_layout(mode='Year', test_types=[], parameter='Temperature of Wat
             dcc.Slider(
                 id='sample-count-slider',
                 min=0,
-                max=df['Sample_Count'].max(),
+                max=location_info['Sample_Count'].max(),
                 step=1,
                 value=0,
-                marks={i: str(i) for i in range(0, df['Sample_Count'].max() + 1, 100)},
+                marks={i: str(i) for i in range(0, location_info['Sample_Count'].max() + 1, 100)},
                 tooltip={"placement": "bottom", "always_visible": False}
             ),
             html.Label("Date: "),
@@ -159,6 +373,13 @@ def render_main_layout(mode='Year', test_types=[], parameter='Temperature of Wat
 
         html.Div([
             html.Button("Play", id="play-button", n_clicks=0),
+            dcc.Checklist(
+                id='animate-toggle',
+                options=[{'label': 'Animate all frames in browser', 'value': 'animate'}],
+                value=[],
+                inline=True,
+                style={"display": "inline-block", "marginLeft": "20px"}
+            ),
             dcc.Interval(id='interval-component', interval=3000, n_intervals=0, disabled=True)
         ], style={"marginTop": "10px", "textAlign": "center"}),
 
@@ -168,16 +389,21 @@ def render_main_layout(mode='Year', test_types=[], parameter='Temperature of Wat
 @app.callback(
     Output('interval-component', 'disabled'),
     Output('play-button', 'children'),
+    Output('play-button', 'disabled'),
     Input('play-button', 'n_clicks'),
+    Input('animate-toggle', 'value'),
     State('interval-component', 'disabled')
 )
-def toggle_play(n_clicks, disabled):
+def toggle_play(n_clicks, animate, disabled):
+    if animate and 'animate' in animate:
+        # The animated map has its own play controls, so no server ticks
+        return True, "Play", True
     if n_clicks % 2 == 1:
         # Odd clicks = playing
-        return False, "Pause"
+        return False, "Pause", False
     else:
         # Even clicks = paused
-        return True, "Play"
+        return True, "Play", False
 
 
 
@@ -232,8 +458,9 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                 ])
             
             loc_data = loc.iloc[0]
-            region = df[df['Location_ID'] == location_id]['Region'].iloc[0] if 'Region' in df.columns else 'Unknown'
-            sample_count = df[df['Location_ID'] == location_id].shape[0]
+            df_loc = get_location_rows(location_id)
+            region = df_loc['Region'].iloc[0] if 'Region' in samples.columns else 'Unknown'
+            sample_count = df_loc.shape[0]
 
             
 
@@ -382,10 +609,10 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                             ),
                             dcc.DatePickerRange(
                                 id='date-picker-range',
-                                min_date_allowed=datetime.date(2000, 1, 1),
-                                max_date_allowed=datetime.date(2025, 12, 31),
-                                start_date=datetime.date(2000, 1, 1),
-                                end_date=datetime.date(2025, 12, 31),
+                                min_date_allowed=datetime.date(period_values['Year'][0], 1, 1),
+                                max_date_allowed=datetime.date(period_values['Year'][-1], 12, 31),
+                                start_date=datetime.date(period_values['Year'][0], 1, 1),
+                                end_date=datetime.date(period_values['Year'][-1], 12, 31),
                                 display_format='YYYY-MM-DD',
                                 style={"marginTop": "20px", "marginBottom": "20px"}
                             ),
@@ -412,10 +639,10 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                                 dcc.Slider(
                                     id="min-sample-slider",
                                     min=0,
-                                    max=df['Sample_Count'].max(),
+                                    max=location_info['Sample_Count'].max(),
                                     step=1,
                                     value=10,
-                                    marks={i: str(i) for i in range(0, df['Sample_Count'].max() + 1, 500)},
+                                    marks={i: str(i) for i in range(0, location_info['Sample_Count'].max() + 1, 500)},
                                     tooltip={"placement": "bottom", "always_visible": False}
                                 ),
                                 html.Br(),
@@ -460,7 +687,7 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                                 html.H5("Top 3 Measured Metrics", style={"marginBottom": "10px"}),
                                 html.Ul([
                                     html.Li(f"{metric} ({count} samples)")
-                                    for metric, count in df[df["Location_ID"] == location_id][cols]
+                                    for metric, count in df_loc[cols]
                                     .count()
                                     .sort_values(ascending=False)
                                     .head(3).items()
@@ -471,7 +698,7 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                                 html.Div("📅", style={"fontSize": "30px", "marginBottom": "5px"}),
                                 html.H5("Last Recorded Sample", style={"marginBottom": "10px"}),
                                 html.P(
-                                    df[df["Location_ID"] == location_id]["Date"].max().strftime("%d %b %Y"),
+                                    df_loc["Date"].max().strftime("%d %b %Y"),
                                     style={"fontSize": "16px"}
                                 )
                             ], style={"marginBottom": "25px"}),
@@ -481,11 +708,11 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                                 html.H5("Sample Interval Range", style={"marginBottom": "10px"}),
 
                                 html.P(
-                                    f"Min Gap: {int(df[df['Location_ID'] == location_id]['Date'].sort_values().diff().dt.days.dropna().min())} days",
+                                    f"Min Gap: {int(df_loc['Date'].diff().dt.days.dropna().min())} days",
                                     style={"marginBottom": "5px"}
                                 ),
                                 html.P(
-                                    f"Max Gap: {int(df[df['Location_ID'] == location_id]['Date'].sort_values().diff().dt.days.dropna().max())} days"
+                                    f"Max Gap: {int(df_loc['Date'].diff().dt.days.dropna().max())} days"
                                 )
                             ])
                         ], style={
@@ -708,10 +935,10 @@ def render_page_content(search, mode, test_types, parameter, slider_val):
                             dcc.Slider(
                                 id='location_sample-count-slider',
                                 min=0,
-                                max=df['Sample_Count'].max(),
+                                max=location_info['Sample_Count'].max(),
                                 step=1,
                                 value=0,
-                                marks={i: str(i) for i in range(0, df['Sample_Count'].max() + 1, 500)},
+                                marks={i: str(i) for i in range(0, location_info['Sample_Count'].max() + 1, 500)},
                                 tooltip={"placement": "bottom", "always_visible": False}
                             ),
                             # Map
@@ -853,9 +1080,22 @@ from urllib.parse import parse_qs
     Input('remove-anomalies1', 'value'),
     Input('selected-locations-store', 'data'),
     Input('comparison-metric-dropdown', 'value'),
-    Input('graph-toggle-checklist', 'value')
+    Input('graph-toggle-checklist', 'value'),
+    Input('comparison-graph', 'relayoutData'),
 )
-def update_comparison_graph(view_type, search, remove_flagged, selected_locations, selected_metric,graph_layers):
+def update_comparison_graph(view_type, search, remove_flagged, selected_locations, selected_metric,graph_layers,relayout_data=None):
+    # Only the "All" view is downsampled, so only there does zooming refetch
+    x_range = None
+    if relayout_data and ctx.triggered_id == 'comparison-graph':
+        x_range = relayout_x_range(relayout_data) if view_type == 'All' else None
+        if x_range is None:
+            return no_update
+    return comparison_figure(view_type, search, remove_flagged, selected_locations, selected_metric, graph_layers,
+                             None if x_range == 'full' else x_range)
+
+
+@figure_cache.memoize('update_comparison_graph')
+def comparison_figure(view_type, search, remove_flagged, selected_locations, selected_metric, graph_layers, x_range=None):
     if not view_type or not search or not selected_metric:
         return go.Figure()
 
@@ -868,27 +1108,39 @@ def update_comparison_graph(view_type, search, remove_flagged, selected_location
 
     fig = go.Figure()
 
-    for loc_id in all_ids:
-        df_loc = df[df['Location_ID'] == loc_id]
-        df_loc['Date'] = pd.to_datetime(df_loc['Date'])
-        df_loc = df_loc.sort_values(by='Date')
-
-        flagged_col = f"{selected_metric}_flagged"
-        has_flagged = flagged_col in df_loc.columns
-
-        if has_flagged:
-            anomalies = df_loc[df_loc[flagged_col]]
-            normals = df_loc[~df_loc[flagged_col]]
-        else:
-            anomalies = df_loc.iloc[0:0]
-            normals = df_loc
-
-        if 'remove' in remove_flagged:
-            df_plot = normals
-            anomalies = df_plot.iloc[0:0]
-        else:
-            df_plot = pd.concat([normals, anomalies]).sort_values(by='Date')
+    flagged_col = f"{selected_metric}_flagged"
+    has_flagged = flagged_col in samples.columns
+    remove = 'remove' in remove_flagged
+    period = 'Year' if view_type == 'Yearly' else 'Month'
+
+    # Every compared location in one batched read; all traces are cut from this
+    # frame (per-location groups from a single groupby) rather than one read,
+    # copy and sort per location
+    columns = ['Location_ID', 'Date', period, selected_metric] + ([flagged_col] if has_flagged else [])
+    rows = get_locations_rows(all_ids, columns)
+    if has_flagged and not remove:
+        anomalies = rows[rows[flagged_col]]
+    elif has_flagged:
+        anomalies = rows.iloc[0:0]
+        rows = rows[~rows[flagged_col]]
+    else:
+        anomalies = rows.iloc[0:0]
+    valid = rows.dropna(subset=[selected_metric])
 
+    if view_type == 'All':
+        valid_by_location = dict(tuple(valid.groupby('Location_ID', observed=True, sort=False)))
+        anomalies_by_location = dict(tuple(anomalies.groupby('Location_ID', observed=True, sort=False)))
+    else:
+        # Yearly/Monthly averages for all locations in one groupby
+        averages = valid.groupby(['Location_ID', period], observed=True)[selected_metric].mean().reset_index()
+        averages_by_location = {
+            loc_id: group.drop(columns='Location_ID').reset_index(drop=True)
+            for loc_id, group in averages.groupby('Location_ID', observed=True, sort=False)
+        }
+
+    # Traces take plain arrays: validating a numpy array is several times cheaper
+    # than a Series, which matters once a dozen locations are compared
+    for loc_id in all_ids:
         is_main = loc_id == main_id
         line_width = 3 if is_main else 2
         dash_style = 'solid'
@@ -896,94 +1148,59 @@ def update_comparison_graph(view_type, search, remove_flagged, selected_location
 
         # === "All" View ===
         if view_type == 'All':
-            valid = df_plot.dropna(subset=[selected_metric])
+            loc_valid = valid_by_location.get(loc_id, valid.iloc[0:0])
             if 'raw' in graph_layers:
+                keep = loc_valid[flagged_col] if has_flagged and not remove else None
+                shown = downsample(loc_valid, 'Date', selected_metric, RAW_TRACE_MAX_POINTS, keep, x_range)
                 fig.add_trace(go.Scatter(
-                    x=valid['Date'],
-                    y=valid[selected_metric],
+                    x=shown['Date'].to_numpy(),
+                    y=shown[selected_metric].to_numpy(),
                     mode='lines+markers',
                     name=f"{loc_id} (raw)",
                     line=dict(width=line_width),
                     marker=dict(size=marker_size)
                 ))
 
-            if not anomalies.empty and has_flagged and 'remove' not in remove_flagged:
-                anomalies_valid = anomalies.dropna(subset=[selected_metric])
-                if 'raw' in graph_layers:
-                    fig.add_trace(go.Scatter(
-                        x=anomalies_valid['Date'],
-                        y=anomalies_valid[selected_metric],
-                        mode='markers',
-                        name=f"{loc_id} Anomalies",
-                        marker=dict(color='red', size=8, symbol='circle-open')
-                    ))
-
-            if not valid.empty:
-                smoothed = lowess(
-                    valid[selected_metric],
-                    valid['Date'].map(datetime.datetime.toordinal),
-                    frac=0.5
-                )
-                if 'lowess' in graph_layers and not df.empty:
-                    fig.add_trace(go.Scatter(
-                        x=pd.to_datetime([datetime.date.fromordinal(int(x)) for x in smoothed[:, 0]]),
-                        y=smoothed[:, 1],
-                        mode='lines',
-                        name=f"{loc_id} (LOWESS)",
-                        line=dict(width=line_width + 1, dash=dash_style)
-                    ))
-
-        # === "Yearly" View ===
-        elif view_type == 'Yearly':
-            df_plot['Year'] = df_plot['Date'].dt.year
-            yearly_avg = df_plot.dropna(subset=[selected_metric]).groupby('Year')[selected_metric].mean().reset_index()
-
-            if yearly_avg.empty:
-                continue
-
-            smoothed = lowess(yearly_avg[selected_metric], yearly_avg['Year'], frac=0.5)
-            yearly_avg['Smoothed'] = smoothed[:, 1]
-            if 'raw' in graph_layers:
+            if loc_id in anomalies_by_location and 'raw' in graph_layers:
+                anomalies_valid = anomalies_by_location[loc_id].dropna(subset=[selected_metric])
                 fig.add_trace(go.Scatter(
-                    x=yearly_avg['Year'],
-                    y=yearly_avg[selected_metric],
-                    mode='lines+markers',
-                    name=f"{loc_id} (yearly avg)",
-                    line=dict(width=line_width),
-                    marker=dict(size=marker_size)
+                    x=anomalies_valid['Date'].to_numpy(),
+                    y=anomalies_valid[selected_metric].to_numpy(),
+                    mode='markers',
+                    name=f"{loc_id} Anomalies",
+                    marker=dict(color='red', size=8, symbol='circle-open')
                 ))
-            if 'lowess' in graph_layers and not df.empty:
+
+            if not loc_valid.empty and 'lowess' in graph_layers and len(samples):
+                smoothed = smoothed_series(loc_id, selected_metric, 'All', remove)
+                smoothed = downsample(smoothed, 'Date', 'Smoothed', RAW_TRACE_MAX_POINTS, x_range=x_range)
                 fig.add_trace(go.Scatter(
-                    x=yearly_avg['Year'],
-                    y=yearly_avg['Smoothed'],
+                    x=smoothed['Date'].to_numpy(),
+                    y=smoothed['Smoothed'].to_numpy(),
                     mode='lines',
                     name=f"{loc_id} (LOWESS)",
                     line=dict(width=line_width + 1, dash=dash_style)
                 ))
 
-        # === "Monthly" View ===
-        elif view_type == 'Monthly':
-            df_plot['Month'] = df_plot['Date'].dt.month
-            monthly_avg = df_plot.dropna(subset=[selected_metric]).groupby('Month')[selected_metric].mean().reset_index()
-
-            if monthly_avg.empty:
+        # === "Yearly" / "Monthly" Views ===
+        elif view_type in ('Yearly', 'Monthly'):
+            period_avg = averages_by_location.get(loc_id)
+            if period_avg is None:
                 continue
 
-            smoothed = lowess(monthly_avg[selected_metric], monthly_avg['Month'], frac=0.5)
-            monthly_avg['Smoothed'] = smoothed[:, 1]
             if 'raw' in graph_layers:
                 fig.add_trace(go.Scatter(
-                    x=monthly_avg['Month'],
-                    y=monthly_avg[selected_metric],
+                    x=period_avg[period].to_numpy(),
+                    y=period_avg[selected_metric].to_numpy(),
                     mode='lines+markers',
-                    name=f"{loc_id} (monthly avg)",
+                    name=f"{loc_id} ({'yearly' if period == 'Year' else 'monthly'} avg)",
                     line=dict(width=line_width),
                     marker=dict(size=marker_size)
                 ))
-            if 'lowess' in graph_layers and not df.empty:
+            if 'lowess' in graph_layers and len(samples):
                 fig.add_trace(go.Scatter(
-                    x=monthly_avg['Month'],
-                    y=monthly_avg['Smoothed'],
+                    x=period_avg[period].to_numpy(),
+                    y=smoothed_series(loc_id, selected_metric, view_type, remove)['Smoothed'].to_numpy(),
                     mode='lines',
                     name=f"{loc_id} (LOWESS)",
                     line=dict(width=line_width + 1, dash=dash_style)
@@ -1003,7 +1220,9 @@ def update_comparison_graph(view_type, search, remove_flagged, selected_location
             itemsizing='constant',        # Prevents marker size from affecting legend item size
             tracegroupgap=0,              # Less vertical gap
             itemwidth=30                  # Shrinks reserved width for legend text (useful in horizontal legends)
-        )
+        ),
+        # Keep the user's zoom while the visible window is refetched
+        uirevision=repr((view_type, main_id, remove_flagged, selected_locations, selected_metric, graph_layers)),
     )
 
     return fig
@@ -1019,8 +1238,22 @@ def update_comparison_graph(view_type, search, remove_flagged, selected_location
     Input('remove-anomalies', 'value'),
     Input('date-picker-range', 'start_date'),
     Input('date-picker-range', 'end_date'),
+    Input('metric-graph', 'relayoutData'),
 )
-def update_metric_graph(selected_metrics, search, remove_flagged, start_date, end_date):
+def update_metric_graph(selected_metrics, search, remove_flagged, start_date, end_date, relayout_data=None):
+    # Zooming refetches the visible window at full resolution; other relayout
+    # events (autosize, y-only zoom) leave the figure as it is
+    x_range = None
+    if relayout_data and ctx.triggered_id == 'metric-graph':
+        x_range = relayout_x_range(relayout_data)
+        if x_range is None:
+            return no_update
+    return metric_figure(selected_metrics, search, remove_flagged, start_date, end_date,
+                         None if x_range == 'full' else x_range)
+
+
+@figure_cache.memoize('update_metric_graph')
+def metric_figure(selected_metrics, search, remove_flagged, start_date, end_date, x_range=None):
     if not selected_metrics or not search:
         return go.Figure()
 
@@ -1029,14 +1262,8 @@ def update_metric_graph(selected_metrics, search, remove_flagged, start_date, en
     if not location_id:
         return go.Figure()
 
-    filtered = df[df['Location_ID'] == location_id].sort_values(by='Date')
-    filtered['Date'] = pd.to_datetime(filtered['Date'])
-
-    # Filter by date range
-    if start_date:
-        filtered = filtered[filtered['Date'] >= pd.to_datetime(start_date)]
-    if end_date:
-        filtered = filtered[filtered['Date'] <= pd.to_datetime(end_date)]
+    # Filter by date range (rows are already Date-sorted)
+    filtered = date_window(get_location_rows(location_id), start_date, end_date)
 
     flagged_col = f"{selected_metrics}_flagged"
     has_flagged = flagged_col in filtered.columns
@@ -1053,18 +1280,19 @@ def update_metric_graph(selected_metrics, search, remove_flagged, start_date, en
     if 'remove' in remove_flagged:
         filtered = normals
         anomalies = filtered.iloc[0:0]  # clear anomalies from plot
-    else:
-        filtered = pd.concat([normals, anomalies]).sort_values(by='Date')
 
     # 📈 Build the figure
     fig = go.Figure()
 
     valid = filtered.dropna(subset=[selected_metrics])
 
-    # Plot raw data as line+markers
+    # Plot raw data as line+markers, downsampled to the points that shape the
+    # line (anomalies always kept)
+    keep = valid[flagged_col] if has_flagged and 'remove' not in remove_flagged else None
+    shown = downsample(valid, 'Date', selected_metrics, RAW_TRACE_MAX_POINTS, keep, x_range)
     fig.add_trace(go.Scatter(
-        x=valid['Date'],
-        y=valid[selected_metrics],
+        x=shown['Date'],
+        y=shown[selected_metrics],
         mode='lines+markers',
         name=f"{selected_metrics} (raw)",
         line=dict(color='blue'),
@@ -1084,14 +1312,11 @@ def update_metric_graph(selected_metrics, search, remove_flagged, start_date, en
 
     # Apply LOWESS smoothing
     if not valid.empty:
-        smoothed = lowess(
-            valid[selected_metrics],
-            valid['Date'].map(datetime.datetime.toordinal),
-            frac=0.5
-        )
+        smoothed = smoothed_series(location_id, selected_metrics, 'All', 'remove' in remove_flagged, start_date, end_date)
+        smoothed = downsample(smoothed, 'Date', 'Smoothed', RAW_TRACE_MAX_POINTS, x_range=x_range)
         fig.add_trace(go.Scatter(
-            x=pd.to_datetime([datetime.date.fromordinal(int(x)) for x in smoothed[:, 0]]),
-            y=smoothed[:, 1],
+            x=smoothed['Date'],
+            y=smoothed['Smoothed'],
             mode='lines',
             name=f"{selected_metrics} (LOWESS)",
             line=dict(color='red', width=4, dash='solid')
@@ -1102,7 +1327,9 @@ def update_metric_graph(selected_metrics, search, remove_flagged, start_date, en
         title=f"{selected_metrics} over Time for Location ID {location_id}",
         margin=dict(t=40, b=40, l=40, r=40),
         xaxis_title='Date',
-        yaxis_title='Value'
+        yaxis_title='Value',
+        # Keep the user's zoom while the visible window is refetched
+        uirevision=repr((selected_metrics, location_id, remove_flagged, start_date, end_date)),
     )
 
     return fig
@@ -1119,7 +1346,7 @@ def update_metrics_summary_table(search):
     if not location_id:
         return html.Div("No location selected.")
 
-    subset = df[df["Location_ID"] == location_id]
+    subset = get_location_rows(location_id)
     if subset.empty:
         return html.Div("No data found for this location.")
 
@@ -1185,7 +1412,7 @@ def update_image(selected_metric):
 )
 def store_selected_locations(clickData, selected_ids, search):
     from urllib.parse import parse_qs
-    print(selected_ids)
+    debug(selected_ids)
     params = parse_qs(search.lstrip("?"))
     current_id = params.get("id", [None])[0]
     
@@ -1195,7 +1422,7 @@ def store_selected_locations(clickData, selected_ids, search):
         return selected_ids
 
     clicked_id = clickData['points'][0]['text']
-    print(f"Existing IDs: {selected_ids}, Clicked: {clicked_id}, Current: {current_id}")
+    debug(f"Existing IDs: {selected_ids}, Clicked: {clicked_id}, Current: {current_id}")
     if not selected_ids:
         selected_ids = []
 
@@ -1229,47 +1456,18 @@ def update_image_1(selected_metric):
 
     return html.Img(src=img_src, style={"maxWidth": "100%", "maxHeight": "100%", "objectFit": "contain"})
 
-@app.callback(
-    Output('over_time-category-table', 'data'),
-    Output('over_time-category-table', 'columns'),
-    Output('over_time-category-table', 'style_data_conditional'),
-    Input('over_time-metric-dropdown', 'value'),
-    Input('url', 'search')  # assuming you're using URL-based ID passing
-)
-def update_category_table(metric, search):
-    from urllib.parse import parse_qs
-    params = parse_qs(search.lstrip('?'))
-    location_id = params.get('id', [None])[0]
-
-    if location_id is None or metric is None:
-        return [], [],[]
-
-    # Filter by location
-    df_loc = df[df['Location_ID'] == location_id]
-
-    # Extract relevant test types used at this location
-    split_test_types = (
-        df_loc['Test_Type']
-        .dropna()
-        .str.lower()
-        .str.split(',')
-        .explode()
-        .str.strip()
-        .unique()
-    )
-    test_type_set = set(split_test_types)
-
-    cluster_col = f"{metric}_shape_over-time"
-    if cluster_col not in df.columns:
-        return [], [],[]
-
+@timings.data_access
+@lru_cache(maxsize=256)
+@shared_cache.memoize('cluster_table')
+def cluster_table(cluster_col, test_types):
+    # Cluster distribution over every location sharing one of test_types. It
+    # depends only on (cluster column, test-type set), so it is cached, and it
+    # reads the small precomputed per-location tables instead of the samples.
     try:
-        # Clean and filter original df for matching test types
-        df_filtered = df[df['Test_Type'].notna()]
-        df_filtered['Test_Type_clean'] = df_filtered['Test_Type'].str.lower().str.strip()
-
-        df_filtered = df_filtered[df_filtered['Test_Type_clean'].isin(test_type_set)]
-        df_filtered = df_filtered.groupby('Location_ID', as_index=False).first()
+        # Each location counts once, under the Test_Type of its first matching row
+        df_filtered = location_test_types[location_test_types['Test_Type_clean'].isin(test_types)]
+        df_filtered = df_filtered.drop_duplicates('Location_ID')
+        df_filtered = df_filtered.join(location_clusters[cluster_col], on='Location_ID')
 
         # Group and pivot
         grouped = (
@@ -1328,12 +1526,49 @@ def update_category_table(metric, search):
         print("Error:", e)
         return [], [],[]
 
+
+@app.callback(
+    Output('over_time-category-table', 'data'),
+    Output('over_time-category-table', 'columns'),
+    Output('over_time-category-table', 'style_data_conditional'),
+    Input('over_time-metric-dropdown', 'value'),
+    Input('url', 'search')  # assuming you're using URL-based ID passing
+)
+def update_category_table(metric, search):
+    from urllib.parse import parse_qs
+    params = parse_qs(search.lstrip('?'))
+    location_id = params.get('id', [None])[0]
+
+    if location_id is None or metric is None:
+        return [], [],[]
+
+    # Filter by location
+    df_loc = get_location_rows(location_id)
+
+    # Extract relevant test types used at this location
+    split_test_types = (
+        df_loc['Test_Type']
+        .dropna()
+        .str.lower()
+        .str.split(',')
+        .explode()
+        .str.strip()
+        .unique()
+    )
+    test_type_set = tuple(sorted(set(split_test_types)))
+
+    cluster_col = f"{metric}_shape_over-time"
+    if cluster_col not in location_clusters.columns:
+        return [], [],[]
+
+    return cluster_table(cluster_col, test_type_set)
+
 @callback(
     Output('selected-locations-list', 'children'),
     Input('selected-locations-store', 'data'),
 )
 def render_selected_list(selected_ids):
-    print("render_selected_list fired with:", selected_ids)
+    debug("render_selected_list fired with:", selected_ids)
     if not selected_ids:
         return html.Div("No locations selected.")
     
@@ -1354,8 +1589,8 @@ def render_selected_list(selected_ids):
 )
 def remove_location(n_clicks_list, selected_ids):
     triggered = ctx.triggered_id
-    print("Triggered:", triggered)
-    print("n_clicks_list:", n_clicks_list)
+    debug("Triggered:", triggered)
+    debug("n_clicks_list:", n_clicks_list)
     
     if not triggered or not isinstance(triggered, dict) or triggered.get('type') != 'remove-button':
         return no_update
@@ -1371,18 +1606,18 @@ def remove_location(n_clicks_list, selected_ids):
             break
 
     if triggered_index is None:
-        print("Triggered index not found in inputs_list!")
+        debug("Triggered index not found in inputs_list!")
         return no_update
 
     # Check the clicks value at that index
     if n_clicks_list[triggered_index] == 0 or n_clicks_list[triggered_index] is None:
-        print("Triggered button has zero clicks, ignoring")
+        debug("Triggered button has zero clicks, ignoring")
         return no_update
 
     selected_ids = selected_ids or []
     removed_id = triggered['index']
     new_selected = [id_ for id_ in selected_ids if id_ != removed_id]
-    print(f"Removing {removed_id}: New list:", new_selected)
+    debug(f"Removing {removed_id}: New list:", new_selected)
     return new_selected
 @app.callback(
     Output('monthly-category-table', 'data'),
@@ -1400,7 +1635,7 @@ def update_category_table1(metric, search):
         return [], [],[]
 
     # Filter by location
-    df_loc = df[df['Location_ID'] == location_id]
+    df_loc = get_location_rows(location_id)
 
     # Extract relevant test types used at this location
     split_test_types = (
@@ -1412,76 +1647,13 @@ def update_category_table1(metric, search):
         .str.strip()
         .unique()
     )
-    test_type_set = set(split_test_types)
+    test_type_set = tuple(sorted(set(split_test_types)))
 
     cluster_col = f"{metric}_shape_yearly"
-    if cluster_col not in df.columns:
+    if cluster_col not in location_clusters.columns:
         return [], [],[]
 
-    try:
-        # Clean and filter original df for matching test types
-        df_filtered = df[df['Test_Type'].notna()]
-        df_filtered['Test_Type_clean'] = df_filtered['Test_Type'].str.lower().str.strip()
-
-        df_filtered = df_filtered[df_filtered['Test_Type_clean'].isin(test_type_set)]
-        df_filtered = df_filtered.groupby('Location_ID', as_index=False).first()
-
-        # Group and pivot
-        grouped = (
-            df_filtered
-            .groupby(['Test_Type', cluster_col])
-            .size()
-            .unstack(fill_value=0)
-            .reset_index()
-        )
-       
-
-        # Ensure cluster columns are ordered (0 to 6)
-        cluster_cols = []
-        for col in grouped.columns:
-            try:
-                cluster_num = int(float(col))  # Handles both '0.0' and 0
-                cluster_cols.append((cluster_num, col))
-            except (ValueError, TypeError):
-                continue
-
-        # Sort by cluster number
-        cluster_cols = sorted(cluster_cols, key=lambda x: x[0])
-
-
-# Identify max cluster column per row 
-
-        # Rebuild ordered list: 'Test_Type_clean' + ordered cluster columns
-        ordered_cols = ['Test_Type'] + [col for _, col in cluster_cols]
-        grouped = grouped[ordered_cols]
-    
-        # Rename columns: Cluster 1–7
-        clusters=[f"Cluster {i+1}" for i, _ in enumerate(cluster_cols)]
-        new_column_names = ['Test Type'] + [f"Cluster {i+1}" for i, _ in enumerate(cluster_cols)]
-        grouped.columns = new_column_names
-       
-        grouped['Max_Cluster'] = grouped[clusters].idxmax(axis=1)
-      
-        style_data_conditional = [
-            {
-                'if': {
-                    'filter_query': f'{{Max_Cluster}} = "{col}"',
-                    'column_id': col
-                },
-                'backgroundColor': '#D2F3FF',
-                'fontWeight': 'bold'
-            }
-            for col in clusters
-        ]
-
-        # Build table data and columns for Dash
-        columns = [{"name": col, "id": col} for col in grouped.columns]
-        data = grouped.to_dict("records")
-        return data, columns, style_data_conditional
-
-    except Exception as e:
-        print("Error:", e)
-        return [], [],[]
+    return cluster_table(cluster_col, test_type_set)
 
 
 @app.callback(
@@ -1489,29 +1661,18 @@ def update_category_table1(metric, search):
     Input('over_time-metric-dropdown', 'value'),
     State('url', 'search')  # or however you're passing search param
 )
+@figure_cache.memoize('update_over_time_avg_graph')
 def update_over_time_avg_graph(metric, search):
     
     params = parse_qs(search.lstrip('?'))
     location_id = params.get('id', [None])[0]
 
-    Flagged =  f'{metric}_flagged'
-
     if location_id is None:
         
         return go.Figure()
 
-    df_loc = df[(df['Location_ID'] == location_id) & (~df[Flagged]) & (df[metric].notna())]
-
-    # Group by Month
-    
-    monthly_avg = df_loc.groupby('Year')[metric].mean().reset_index()
-    monthly_avg = monthly_avg.dropna(subset=[metric])
-   
-
-    # LOWESS smoothing
- 
-    smoothed = lowess(monthly_avg[metric], monthly_avg['Year'].astype(np.int64), frac=0.5)
-    monthly_avg['Smoothed'] = smoothed[:, 1]
+    # Unflagged yearly averages with LOWESS smoothing (cached)
+    monthly_avg = smoothed_series(location_id, metric, 'Yearly', remove_anomalies=True)
 
     # Plot
     fig = go.Figure()
@@ -1543,29 +1704,18 @@ def update_over_time_avg_graph(metric, search):
     Input('monthly-metric-dropdown', 'value'),
     State('url', 'search')  # or however you're passing search param
 )
+@figure_cache.memoize('update_monthly_avg_graph')
 def update_monthly_avg_graph(metric, search):
 
     params = parse_qs(search.lstrip('?'))
     location_id = params.get('id', [None])[0]
 
-    Flagged =  f'{metric}_flagged'
-
     if location_id is None:
         
         return go.Figure()
 
-    df_loc = df[(df['Location_ID'] == location_id) & (~df[Flagged]) & (df[metric].notna())]
-  
-    # Group by Month
-    
-    monthly_avg = df_loc.groupby('Month')[metric].mean().reset_index()
-    monthly_avg = monthly_avg.dropna(subset=[metric])
-   
-
-    # LOWESS smoothing
- 
-    smoothed = lowess(monthly_avg[metric], monthly_avg['Month'].astype(np.int64), frac=0.5)
-    monthly_avg['Smoothed'] = smoothed[:, 1]
+    # Unflagged monthly averages with LOWESS smoothing (cached)
+    monthly_avg = smoothed_series(location_id, metric, 'Monthly', remove_anomalies=True)
 
     # Plot
     fig = go.Figure()
@@ -1606,9 +1756,9 @@ def update_yearly_metric_display(metric, search):
     yearly_col = f'{metric}_shape_yearly'
 
     # Filter df for the location and check if yearly_col exists
-    df_loc = df[df['Location_ID'] == location_id]
+    df_loc = get_location_rows(location_id)
 
-    if yearly_col not in df.columns or df_loc.empty:
+    if yearly_col not in samples.columns or df_loc.empty:
         return "Not enough data points to categorise"
 
     # Get the unique yearly value for that location (assuming it's the same for all rows)
@@ -1642,9 +1792,9 @@ def update_yearly_metric_display(metric, search):
     yearly_col = f'{metric}_shape_over-time'
 
     # Filter df for the location and check if yearly_col exists
-    df_loc = df[df['Location_ID'] == location_id]
+    df_loc = get_location_rows(location_id)
 
-    if yearly_col not in df.columns or df_loc.empty:
+    if yearly_col not in samples.columns or df_loc.empty:
         return "Not enough data points to categorise"
 
     # Get the unique yearly value for that location (assuming it's the same for all rows)
@@ -1674,15 +1824,6 @@ def go_home(n_clicks):
     return no_update
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # km
-    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1 
-    dlon = lon2 - lon1 
-    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
-    c = 2 * np.arcsin(np.sqrt(a)) 
-    return R * c
-
 @app.callback(
     Output("nearest-locations-box", "children"),
     Input("min-sample-slider", "value"),
@@ -1705,20 +1846,19 @@ def update_nearest_locations(min_samples, selected_types, search):
     cur_lat = current.iloc[0]['Latitude']
     cur_lon = current.iloc[0]['Longitude']
 
-    # Filter by test type and sample count
-    filtered = location_info[location_info['Location_ID'] != location_id]
-    if selected_types:
-            pattern = '|'.join([fr'\b{t}\b' for t in selected_types])
-            filtered = filtered[filtered['Test_Type'].str.contains(pattern, case=False, na=False, regex=True)]
-    if min_samples:
-
-        filtered = filtered[filtered['Sample_Count'] >= min_samples]
+    # Filter by test type and sample count, applied to the tree's candidates
+    bits = test_type_bits(selected_types)
 
-    # Calculate distances
-    filtered['Distance_km'] = haversine(cur_lat, cur_lon, filtered['Latitude'], filtered['Longitude'])
+    def keep(candidates):
+        ok = candidates['Location_ID'] != location_id
+        if selected_types:
+            ok &= (candidates['Test_Type_bits'] & bits) != 0
+        if min_samples:
+            ok &= candidates['Sample_Count'] >= min_samples
+        return ok
 
     # Get top 5
-    nearest = filtered.nsmallest(5, 'Distance_km')
+    nearest = location_tree.nearest(cur_lat, cur_lon, 5, keep)
 
     return [
         dcc.Link(
@@ -1763,10 +1903,10 @@ def update_slider(mode, n_intervals, current_value, slider_min, slider_max):
 
     # Get values list based on mode
     if mode == 'Year':
-        values = sorted(df['Year'].dropna().unique())
+        values = period_values['Year']
         marks = {i: {"label": str(v)} for i, v in enumerate(values)}
     else:
-        months = sorted(int(v) for v in df['Month'].dropna().unique())
+        months = period_values['Month']
         marks = {i: {"label": calendar.month_abbr[v]} for i, v in enumerate(months)}
         values = months
 
@@ -1796,6 +1936,67 @@ def update_slider(mode, n_intervals, current_value, slider_min, slider_max):
     return new_value, marks, min_val, max_val
 
 
+def map_is_animated(*args):
+    # The animated map depends on which input fired, so it bypasses the figure cache
+    animate = args[5] if len(args) > 5 else None
+    return bool(animate and 'animate' in animate)
+
+
+@lru_cache(maxsize=32)
+def build_animated_map(mode, test_types, col_use, min_sample_count):
+    # Every slider position for one selection in a single figure with Plotly
+    # frames, so playback runs in the browser without server round-trips
+    frames = []
+    for value in period_values[mode]:
+        avg = map_location_means(mode, value, col_use, test_types, min_sample_count)
+        frame = location_info.merge(avg, on="Location_ID", how="inner")
+        frame[mode] = str(value) if mode == 'Year' else calendar.month_abbr[value]
+        frames.append(frame)
+    temp_map = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if temp_map.empty:
+        return None
+
+    temp_min, temp_max = colour_range(col_use, test_types)
+    tickvals = np.linspace(temp_min, temp_max, 10)
+    ticktext = [f"{tickvals[0]:.1f} (and below)"] + \
+            [f"{val:.1f}" for val in tickvals[1:-1]] + \
+            [f"{tickvals[-1]:.1f} (and above)"]
+
+    fig = px.scatter_map(
+        temp_map,
+        lat="Latitude",
+        lon="Longitude",
+        hover_name="Location_Name",
+        hover_data={"Test_Type": True, col_use: True},
+        color=col_use,
+        color_continuous_scale="Plasma",
+        range_color=[temp_min, temp_max],
+        animation_frame=mode,
+        animation_group="Location_ID",
+        zoom=5,
+        height=600,
+    )
+    fig.update_traces(marker=dict(size=15))
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+    fig.update_layout(coloraxis_colorbar=dict(
+        tickvals=tickvals,
+        ticktext=ticktext,
+    ))
+    for frame in fig.frames:
+        for trace in frame.data:
+            trace.marker.size = 15
+    # Map traces must be redrawn on every frame. With a single period left
+    # after filtering there is nothing to play and no controls to adjust.
+    if fig.layout.updatemenus:
+        play = fig.layout.updatemenus[0].buttons[0]
+        play.args[1]["frame"] = {"duration": ANIMATION_FRAME_MS, "redraw": True}
+        play.args[1]["transition"] = {"duration": 0}
+    if fig.layout.sliders:
+        for step in fig.layout.sliders[0].steps:
+            step.args[1]["frame"]["redraw"] = True
+    return fig
+
+
 @callback(
     Output('map', 'figure'),
     Input('time-slider', 'value'),
@@ -1803,19 +2004,30 @@ def update_slider(mode, n_intervals, current_value, slider_min, slider_max):
     Input('test-type-filter', 'value'),
     Input('parameter-selector', 'value'),
     Input('sample-count-slider', 'value'),
+    Input('animate-toggle', 'value'),
 )
-def update_map(selected_index, mode, selected_test_types,selected_param,min_sample_count):
-    flag_col = f"{selected_param}_flagged"
+@figure_cache.memoize('update_map', skip=map_is_animated)
+def update_map(selected_index, mode, selected_test_types,selected_param,min_sample_count,animate=None):
     col_use = selected_param
+    test_types = tuple(sorted(set(selected_test_types or [])))
+
+    if animate and 'animate' in animate:
+        # The animated figure carries its own slider, so ignore the Dash one
+        # unless something else changed in the same request
+        if set(ctx.triggered_prop_ids) == {'time-slider.value'}:
+            return no_update
+        fig = build_animated_map(mode, test_types, col_use, min_sample_count)
+        if fig is not None:
+            return fig
     # Filter df based on mode and selected index
 
     if selected_test_types:
-        pattern = '|'.join([fr'\b{t}\b' for t in selected_test_types])
-        base_df = df[df['Test_Type'].str.contains(pattern, case=False, na=False, regex=True)]
-    else: base_df=df
+        present = map_cube[mode][1].index.unique(level="Test_Type_bits")
+        no_match = not ((present & test_type_bits(selected_test_types)) != 0).any()
+    else: no_match = False
     
     
-    if base_df.empty:
+    if no_match:
         return go.Figure().update_layout(
             mapbox_style="open-street-map",
             mapbox_center={"lat": 50.5, "lon": -4.5},
@@ -1833,17 +2045,15 @@ def update_map(selected_index, mode, selected_test_types,selected_param,min_samp
             )]
         )
 
-    if mode == 'Year':
-        time_value = 2000 + selected_index  # Fixed year range starting from 2000
-        filtered = base_df[(base_df['Year'] == time_value) & (base_df[flag_col] != True)]
-    else:
-        time_value = selected_index + 1  # Months 1–12
-        filtered = base_df[(base_df['Month'] == time_value) & (base_df[flag_col] != True)]
-    filtered = filtered[filtered['Sample_Count'] >= min_sample_count]
+    # Slider positions index the periods present in the data, as in update_slider;
+    # a stale position from the other mode matches nothing
+    values = period_values[mode]
+    time_value = values[selected_index] if 0 <= selected_index < len(values) else None
 
+    # Average per location for this frame, looked up from the precomputed cube
+    avg_temp_filtered = map_location_means(mode, time_value, col_use, selected_test_types, min_sample_count)
 
-    # Calculate average temperature per location from filtered data
-    if filtered.empty:
+    if avg_temp_filtered.empty:
         fig = go.Figure()
 
         fig.update_layout(
@@ -1867,25 +2077,12 @@ def update_map(selected_index, mode, selected_test_types,selected_param,min_samp
         )
         return fig
 
-    avg_temp_filtered = filtered.groupby("Location_ID")[col_use].mean().reset_index()
-
 
     # Merge with location info
     temp_map = location_info.merge(avg_temp_filtered, on="Location_ID", how="left")
     temp_map= temp_map[temp_map[col_use].notnull()]
-    # Compute overall min and max temperature for color scale from ALL unflagged data
-    all_unflagged = df[df[flag_col] != True]
-    if selected_test_types:
-        pattern = '|'.join([fr'\b{t}\b' for t in selected_test_types])
-        all_unflagged= all_unflagged[all_unflagged['Test_Type'].str.contains(pattern, case=False, na=False, regex=True)]
-
-    temp_min = all_unflagged[col_use].quantile(0.05)
-    temp_max = all_unflagged[col_use].quantile(0.95)
-
-    # Avoid identical values
-    if temp_min == temp_max:
-        temp_min -= 0.1
-        temp_max += 0.1
+    # Colour scale from ALL unflagged data, cached per (parameter, test types)
+    temp_min, temp_max = colour_range(col_use, test_types)
 
     tickvals = np.linspace(temp_min, temp_max, 10)
     
@@ -1951,6 +2148,7 @@ def update_map(selected_index, mode, selected_test_types,selected_param,min_samp
     Input('location_sample-count-slider', 'value'),
     Input('url', 'search'),
 )
+@figure_cache.memoize('update_location_map')
 def update_location_map(selected_test_types,min_sample_count,search):
     params = parse_qs(search.lstrip('?'))
     location_id = params.get('id', [None])[0]
@@ -1961,13 +2159,12 @@ def update_location_map(selected_test_types,min_sample_count,search):
     # Filter df based on mode and selected index
 
     if selected_test_types:
-        pattern = '|'.join([fr'\b{t}\b' for t in selected_test_types])
-        base_df = location_info[location_info['Test_Type'].str.contains(pattern, case=False, na=False, regex=True)]
+        base_df = location_info[(location_info['Test_Type_bits'] & test_type_bits(selected_test_types)) != 0]
     else: base_df = location_info
  
     
     base_df = base_df[base_df['Location_ID'] != location_id]
-    print(current_point)
+    debug(current_point)
     # Current location point
     
     
@@ -2076,14 +2273,16 @@ def display_location_data(clickData, selected_index, mode,selected_param):
     
 
     if mode == 'Year':
-        years = sorted(int(v) for v in df['Year'].dropna().unique())
+        years = period_values['Year']
         time_value = years[selected_index]
-        filtered = df[(df['Year'] == time_value) & (df['Location_ID'] == location_id)]
+        df_loc = get_location_rows(location_id)
+        filtered = df_loc[df_loc['Year'] == time_value]
         display_time = str(time_value)
     else:
-        months = sorted(int(v) for v in df['Month'].dropna().unique())
+        months = period_values['Month']
         time_value = months[selected_index]
-        filtered = df[(df['Month'] == time_value) & (df['Location_ID'] == location_id)]
+        df_loc = get_location_rows(location_id)
+        filtered = df_loc[df_loc['Month'] == time_value]
         display_time = calendar.month_abbr[time_value]
 
     avg_temp = filtered[selected_param].mean()
@@ -2110,5 +2309,92 @@ def display_location_data(clickData, selected_index, mode,selected_param):
 
     ])
 
+# Time every registered callback (app.callback and dash.callback ones)
+timings.instrument(app.callback_map, GLOBAL_CALLBACK_MAP)
+timings.attach(server)
+
+
+def load_dataset():
+    # New snapshot for the reloader, built alongside the one being served;
+    # after an append only the new fragments are read
+    new_tables, version = load_tables(DATASET_PATH, lazy=LAZY_SAMPLES, mmap=MMAP_SAMPLES, previous=tables["samples"])
+    return (new_tables, dataset_state(new_tables)), version
+
+
+def clear_result_caches():
+    # Rendered figures and every per-process memo of results from the dataset
+    figure_cache.clear()
+    for cached in (colour_range.__wrapped__, cluster_table.__wrapped__, smoothed_series, build_animated_map):
+        cached.cache_clear()
+
+
+def swap_dataset(snapshot, version):
+    # Install a loaded snapshot and drop everything cached from the old one;
+    # runs while no callback request is in flight
+    global tables, dataset_version
+    tables, state = snapshot
+    globals().update(state)
+    dataset_version = version
+    figure_cache.version = shared_cache.version = version
+    clear_result_caches()
+    print(f"Dataset version: {dataset_version}")
+
+
+# Status at GET /admin/reload
+reloader = DatasetReloader(
+    load_dataset, swap_dataset, dataset_version,
+    watch=[DATASET_PATH, os.path.join(SERVING_DIR, MANIFEST)], poll_seconds=DATASET_POLL_SECONDS,
+)
+reloader.attach(server, token=RELOAD_TOKEN)
+
+
+@metrics.register
+def callback_metrics():
+    requests, errors, duration, data, payload = [], [], [], [], []
+    with timings.lock:
+        for name, stats in sorted(timings.stats.items()):
+            labels = {"output": stats.outputs, "callback": name}
+            requests.append(("", labels, stats.wall_ms.count))
+            errors.append(("", labels, stats.errors))
+            duration += histogram_samples(stats.wall_ms, labels, 1e-3)
+            data.append(("", labels, stats.data_ms.sum * 1e-3))
+            payload += histogram_samples(stats.payload_bytes, labels)
+    return [
+        family("dash_callback_requests_total", "counter", "Callback invocations by output id.", requests),
+        family("dash_callback_errors_total", "counter", "Callback invocations that raised.", errors),
+        family("dash_callback_duration_seconds", "histogram", "Callback wall time.", duration),
+        family("dash_callback_data_seconds_total", "counter", "Callback time spent reading sample data.", data),
+        family("dash_callback_response_bytes", "histogram", "Callback JSON response size.", payload),
+    ]
+
+
+@metrics.register
+def cache_metrics():
+    stats = figure_cache.stats()
+    hits = [("", {"callback": name}, c["hits"]) for name, c in stats["callbacks"].items()]
+    misses = [("", {"callback": name}, c["misses"]) for name, c in stats["callbacks"].items()]
+    return [
+        family("figure_cache_hits_total", "counter", "In-process figure cache hits.", hits),
+        family("figure_cache_misses_total", "counter", "In-process figure cache misses.", misses),
+        family("figure_cache_evictions_total", "counter", "Figures evicted for space.", [("", {}, stats["evictions"])]),
+        family("figure_cache_bytes", "gauge", "Serialised size of cached figures.", [("", {}, stats["bytes"])]),
+        family("shared_cache_hits_total", "counter", "Shared disk cache hits.", [("", {}, shared_cache.hits)]),
+        family("shared_cache_misses_total", "counter", "Shared disk cache misses.", [("", {}, shared_cache.misses)]),
+    ]
+
+
+@metrics.register
+def process_metrics():
+    return [
+        family("dataset_info", "gauge", "Loaded dataset version.", [("", {"version": dataset_version}, 1)]),
+        family("dataset_load_seconds", "gauge", "Time to load the serving tables at startup.", [("", {}, dataset_load_seconds)]),
+        family("dataset_rows", "gauge", "Sample rows loaded.", [("", {}, len(samples))]),
+        family("dataset_reloads_total", "counter", "Dataset snapshots swapped in without a restart.", [("", {}, reloader.reloads)]),
+        family("process_resident_memory_bytes", "gauge", "Resident memory.", [("", {}, resident_memory_bytes())]),
+    ]
+
+
+metrics.attach(server)
+
 if __name__ == '__main__':
     app.run(debug=False)
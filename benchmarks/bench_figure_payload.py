@@ -0,0 +1,59 @@
+# Figure payload size and server-side encode time: the default JSON encoding
+# (ISO date strings, float64) versus the BINARY_FIGURES typed-array encoding,
+# for the map, metric graph and 10-site comparison graph.
+#
+#   python benchmarks/bench_figure_payload.py [--repeat 20] [--max-points 1000]
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+from dash._utils import to_json
+
+import app
+from encoding import pack_figure
+
+
+def time_encode(figure, encode, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = to_json(encode(figure))
+        samples.append(time.perf_counter() - start)
+    return len(body), np.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-points", type=int, default=app.RAW_TRACE_MAX_POINTS,
+                        help="raw trace point cap (LTTB); a large value sends every sample")
+    args = parser.parse_args()
+    app.RAW_TRACE_MAX_POINTS = args.max_points
+
+    # The callbacks' figure builders, bypassing the figure cache
+    sites = list(app.location_info.sort_values("Sample_Count", ascending=False)["Location_ID"])
+    search = f"?id={sites[0]}"
+    metric = app.cols[1]
+    figures = {
+        "map": app.update_map.__wrapped__(0, "Year", [], metric, 0, []),
+        "metric graph": app.metric_figure.__wrapped__(metric, search, [], None, None),
+        "comparison (10 sites)": app.comparison_figure.__wrapped__("All", search, [], sites[1:10], metric, ["raw", "lowess"]),
+    }
+
+    print(f"{'figure':<24} {'json KB':>9} {'json ms':>8} {'binary KB':>10} {'binary ms':>10} {'size':>6}")
+    for name, figure in figures.items():
+        json_bytes, json_ms = time_encode(figure, lambda f: f, args.repeat)
+        binary_bytes, binary_ms = time_encode(figure, pack_figure, args.repeat)
+        print(f"{name:<24} {json_bytes / 1024:>9.1f} {json_ms:>8.2f} {binary_bytes / 1024:>10.1f} "
+              f"{binary_ms:>10.2f} {binary_bytes / json_bytes:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
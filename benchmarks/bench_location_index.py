@@ -0,0 +1,97 @@
+# Page-open latency against row count: full-table Location_ID masks (the old
+# callback path) versus slices from the presorted location index.
+#
+#   python benchmarks/bench_location_index.py [--scales 1 5 20] [--repeat 20]
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import pandas as pd
+
+import app
+from dataset import build_location_index
+
+# Roughly the number of per-location lookups fired when a location page opens
+LOOKUPS_PER_PAGE = 10
+
+
+def scale_frame(frame, factor):
+    # Replicate the dataset under new Location_IDs so rows and sites grow together
+    parts = []
+    for i in range(factor):
+        part = frame.copy()
+        if i:
+            part["Location_ID"] = part["Location_ID"] + f"_{i}"
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def time_page(fn, location_ids, repeat):
+    samples = []
+    for _ in range(repeat):
+        for loc_id in location_ids:
+            start = time.perf_counter()
+            for _ in range(LOOKUPS_PER_PAGE):
+                fn(loc_id)
+            samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    base = pd.read_parquet("mappable.parquet")
+    location_ids = list(base["Location_ID"].drop_duplicates().sample(5, random_state=0))
+
+    print(f"{'rows':>10} {'build ms':>10} {'mask ms':>10} {'index ms':>10} {'speedup':>8}")
+    for factor in args.scales:
+        frame = scale_frame(base, factor)
+
+        start = time.perf_counter()
+        indexed, slices = build_location_index(frame)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        def masked(loc_id):
+            return frame[frame["Location_ID"] == loc_id]
+
+        def sliced(loc_id):
+            s, e = slices[loc_id]
+            return indexed.iloc[s:e]
+
+        mask_ms = time_page(masked, location_ids, args.repeat)
+        index_ms = time_page(sliced, location_ids, args.repeat)
+        print(f"{len(frame):>10} {build_ms:>10.1f} {mask_ms:>10.2f} {index_ms:>10.3f} {mask_ms / index_ms:>7.0f}x")
+
+    # End-to-end page open on the loaded dataset, calling the callbacks directly
+    search = f"?id={location_ids[0]}"
+    metric = app.cols[1]
+    page = [
+        lambda: app.render_page_content(search, "Year", [], metric, 0),
+        lambda: app.update_metric_graph(metric, search, [], "2000-01-01", "2025-12-31"),
+        lambda: app.update_metrics_summary_table(search),
+        lambda: app.update_over_time_avg_graph(metric, search),
+        lambda: app.update_monthly_avg_graph(metric, search),
+        lambda: app.update_category_table(metric, search),
+        lambda: app.update_category_table1(metric, search),
+    ]
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for fn in page:
+            fn()
+        samples.append(time.perf_counter() - start)
+    print(f"\nlocation page open ({len(app.samples)} rows): {np.median(samples) * 1000:.1f} ms median")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Nearest-location lookup: brute-force haversine over the whole catalogue (the
+# old update_nearest_locations path) versus the KD-tree LocationIndex, for
+# synthetic site catalogues from South West to national size.
+#
+#   python benchmarks/bench_nearest.py [--sizes 67 1000 10000 100000] [--queries 200]
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import pandas as pd
+
+from spatial import LocationIndex, haversine
+
+
+def catalogue(size, rng):
+    # Random sites over Great Britain with a few test-type bits and sample counts
+    return pd.DataFrame({
+        "Location_ID": [f"S{i:07d}" for i in range(size)],
+        "Latitude": rng.uniform(50.0, 58.5, size),
+        "Longitude": rng.uniform(-6.0, 1.8, size),
+        "Test_Type_bits": rng.integers(1, 64, size),
+        "Sample_Count": rng.integers(1, 3000, size),
+    })
+
+
+def brute_force(locations, lat, lon, location_id, bits, min_samples):
+    filtered = locations[locations["Location_ID"] != location_id]
+    filtered = filtered[(filtered["Test_Type_bits"] & bits) != 0]
+    filtered = filtered[filtered["Sample_Count"] >= min_samples]
+    filtered = filtered.assign(Distance_km=haversine(lat, lon, filtered["Latitude"], filtered["Longitude"]))
+    return filtered.nsmallest(5, "Distance_km")
+
+
+def indexed(tree, lat, lon, location_id, bits, min_samples):
+    def keep(candidates):
+        return (
+            (candidates["Location_ID"] != location_id)
+            & ((candidates["Test_Type_bits"] & bits) != 0)
+            & (candidates["Sample_Count"] >= min_samples)
+        )
+    return tree.nearest(lat, lon, 5, keep)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[67, 1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'sites':>8} {'build ms':>9} {'brute ms':>9} {'tree ms':>9} {'speedup':>8}")
+    for size in args.sizes:
+        locations = catalogue(size, rng)
+        start = time.perf_counter()
+        tree = LocationIndex(locations)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        queries = locations.sample(min(args.queries, size), random_state=0)
+        brute, tree_times = [], []
+        for row in queries.itertuples():
+            bits, min_samples = int(rng.integers(1, 64)), int(rng.integers(0, 1500))
+            start = time.perf_counter()
+            expected = brute_force(locations, row.Latitude, row.Longitude, row.Location_ID, bits, min_samples)
+            brute.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            got = indexed(tree, row.Latitude, row.Longitude, row.Location_ID, bits, min_samples)
+            tree_times.append(time.perf_counter() - start)
+            assert list(got["Location_ID"]) == list(expected["Location_ID"]), row.Location_ID
+
+        brute_ms, tree_ms = np.median(brute) * 1000, np.median(tree_times) * 1000
+        print(f"{size:>8} {build_ms:>9.1f} {brute_ms:>9.2f} {tree_ms:>9.2f} {brute_ms / tree_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# Benchmark suite for the dashboard callbacks: latency (p50/p95), peak
+# allocation and payload size per scenario, called directly and through the
+# Flask test client, on the real dataset and on synthetic copies scaled up by
+# replicating sites. Results are checked against benchmarks/baselines.json.
+#
+#   python benchmarks/suite.py                      # 1x, compare with baselines
+#   python benchmarks/suite.py --scales 1 10 100    # also 10x / 100x datasets
+#   python benchmarks/suite.py --update-baselines   # record the current numbers
+#   python benchmarks/suite.py --dataset national.parquet   # e.g. from synthetic.py
+#
+# Each scale runs in a fresh interpreter (the app loads its data at import)
+# with the shared cache off. Every timed pass starts with the figure cache and
+# the app's other result memos cleared, so calls measure real builds. Only p50
+# is gated (p95 over a handful of calls per pass is too noisy), and as a ratio
+# to a fixed reference workload timed between the passes: shared and
+# throttled hosts drift by half again over a few minutes, which an absolute
+# tolerance either misses or flags as a regression.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES = ROOT / "benchmarks" / "baselines.json"
+# Allowed growth over the baseline before a result counts as a regression
+TOLERANCE = {"p50_rel": 0.35, "peak_mb": 0.5, "payload_bytes": 0.1}
+# Files the app needs next to the dataset when run from a scaled copy
+APP_FILES = ["app.py", "dataset.py", "spatial.py", "figure_cache.py", "shared_cache.py", "downsample.py",
+             "encoding.py", "instrumentation.py", "metrics.py", "hot_reload.py", "templates", "assets"]
+
+
+def scale_dataset(source, factor, out_path):
+    # Replicate every site `factor` times under new Location_IDs, shifted by a
+    # few km so nearest-site queries see a denser catalogue
+    import numpy as np
+    import pandas as pd
+
+    base = pd.read_parquet(source)
+    rng = np.random.default_rng(0)
+    parts = [base]
+    for i in range(1, factor):
+        part = base.copy()
+        shift = {loc: rng.normal(0, 0.05, 2) for loc in part["Location_ID"].unique()}
+        offsets = np.array([shift[loc] for loc in part["Location_ID"]])
+        part["Latitude"] = part["Latitude"] + offsets[:, 0]
+        part["Longitude"] = part["Longitude"] + offsets[:, 1]
+        part["Location_ID"] = part["Location_ID"].astype(str) + f"_{i}"
+        part["Location_Name"] = part["Location_Name"].astype(str) + f" ({i})"
+        parts.append(part)
+    pd.concat(parts, ignore_index=True).to_parquet(out_path)
+
+
+def workdir_for(factor, cache_dir):
+    # Directory that looks like the repo but holds a scaled mappable.parquet
+    if factor == 1:
+        return ROOT
+    workdir = Path(cache_dir) / f"scale_{factor}"
+    workdir.mkdir(parents=True, exist_ok=True)
+    for name in APP_FILES:
+        link = workdir / name
+        if not link.exists():
+            link.symlink_to(ROOT / name)
+    if not (workdir / "mappable.parquet").exists():
+        print(f"building {factor}x dataset in {workdir}", file=sys.stderr)
+        scale_dataset(ROOT / "mappable.parquet", factor, workdir / "mappable.parquet")
+    return workdir
+
+
+def percentile(values, q):
+    import numpy as np
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def reference_ms():
+    # A fixed mix of the work the callbacks do (pandas group-bys, Python-level
+    # dict building, JSON encoding), timed to gauge how fast the host is right now
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"key": rng.integers(0, 500, 100_000), "value": rng.normal(size=100_000)})
+    start = time.perf_counter()
+    stats = frame.groupby("key")["value"].agg(["mean", "std", "count"]).sort_values("mean")
+    json.dumps([{"key": int(k), **{c: float(v) for c, v in row.items()}} for k, row in stats.iterrows()])
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(calls, repeat, payload_size, reset):
+    # An untimed warm-up pass (imports, first-use setup), then `repeat` timed
+    # passes and one under tracemalloc, each starting from empty caches.
+    # p50 is taken over each call's median across the passes: scenarios mix
+    # cheap and expensive calls, and a median over all the timings lands
+    # between the two groups. The reference workload runs before every pass.
+    for call in calls:
+        call()
+    latencies, reference, payload = [[] for _ in calls], [], 0
+    for r in range(repeat):
+        reset()
+        reference.append(percentile([reference_ms() for _ in range(3)], 50))
+        for call, timings in zip(calls, latencies):
+            start = time.perf_counter()
+            result = call()
+            timings.append((time.perf_counter() - start) * 1000)
+            if r == 0:
+                payload += payload_size(result)
+    reset()
+    tracemalloc.start()
+    for call in calls:
+        call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50 = percentile([percentile(t, 50) for t in latencies], 50)
+    return {
+        "calls": len(calls),
+        "p50_ms": round(p50, 3),
+        "p50_rel": round(p50 / percentile(reference, 50), 3),
+        "p95_ms": round(percentile([ms for t in latencies for ms in t], 95), 3),
+        "peak_mb": round(peak / 1e6, 2),
+        "payload_bytes": payload,
+    }
+
+
+def dash_request(app, client, output, values, changed=None):
+    # POST a callback update the way the renderer does, with input then state
+    # values in declaration order; `changed` is the triggering prop id
+    # (default: the first input). Returns the response body
+    entry = app.app.callback_map[output]
+    specs = entry["inputs"] + entry["state"]
+    props = [{**spec, "value": value} for spec, value in zip(specs, values)]
+    if output.startswith(".."):
+        outputs = [dict(zip(("id", "property"), o.rsplit(".", 1))) for o in output.strip(".").split("...")]
+    else:
+        outputs = dict(zip(("id", "property"), output.split("@")[0].rsplit(".", 1)))
+    body = {
+        "output": output,
+        "outputs": outputs,
+        "inputs": props[:len(entry["inputs"])],
+        "state": props[len(entry["inputs"]):],
+        "changedPropIds": [changed or f"{specs[0]['id']}.{specs[0]['property']}"],
+    }
+    response = client.post("/_dash-update-component", json=body)
+    assert response.status_code in (200, 204), (output, response.status_code)
+    return response.get_data()
+
+
+def run_scenarios(repeat):
+    # Runs inside the (possibly scaled) working directory
+    sys.path.insert(0, os.getcwd())
+    import app
+    from dash._utils import to_json
+
+    def payload_size(result):
+        return len(to_json(result))
+
+    location_ids = list(app.location_info.sort_values("Sample_Count", ascending=False)["Location_ID"])
+    main = location_ids[0]
+    search = f"?id={main}"
+    metric = app.cols[1]
+
+    direct = {
+        "map_sweep": [
+            (lambda i=i, col=col: app.update_map(i, "Year", [], col, 0, []))
+            for i in range(len(app.period_values["Year"])) for col in app.cols
+        ] + [
+            (lambda i=i, col=col: app.update_map(i, "Month", [], col, 0, []))
+            for i in range(len(app.period_values["Month"])) for col in app.cols[:3]
+        ],
+        "location_page": [
+            lambda: app.render_page_content(search, "Year", [], metric, 0),
+            lambda: app.update_metric_graph(metric, search, [], None, None),
+            lambda: app.update_metrics_summary_table(search),
+            lambda: app.update_over_time_avg_graph(metric, search),
+            lambda: app.update_monthly_avg_graph(metric, search),
+            lambda: app.update_category_table(metric, search),
+            lambda: app.update_category_table1(metric, search),
+            lambda: app.update_location_map([], 0, search),
+            lambda: app.update_nearest_locations(0, [], search),
+        ],
+        "comparison_10": [
+            (lambda view=view: app.update_comparison_graph(view, search, [], location_ids[1:10], metric, ["raw", "lowess"]))
+            for view in ("All", "Yearly", "Monthly")
+        ],
+        "nearest": [
+            (lambda loc=loc, n=n: app.update_nearest_locations(n, [], f"?id={loc}"))
+            for loc in location_ids[::max(1, len(location_ids) // 50)] for n in (0, 500)
+        ],
+    }
+
+    client = app.server.test_client()
+    client.get("/")
+    http = {
+        "map_sweep": [
+            (lambda i=i, col=col: dash_request(app, client, "map.figure", [i, "Year", [], col, 0, []]))
+            for i in range(len(app.period_values["Year"])) for col in app.cols[:3]
+        ],
+        # Whole animation, and a filter that leaves a single year of data on
+        # the bundled dataset (one frame: no play button or slider)
+        "map_animated": [
+            lambda: dash_request(app, client, "map.figure", [0, "Year", [], metric, 0, ["animate"]],
+                                 "animate-toggle.value"),
+            lambda: dash_request(app, client, "map.figure",
+                                 [0, "Year", ["any sewage"], 'Oxygen, Dissolved, % Saturation (%)', 0, ["animate"]],
+                                 "animate-toggle.value"),
+        ],
+        "location_page": [
+            lambda: dash_request(app, client, "main-content.children", [search, "Year", [], metric, 0]),
+            lambda: dash_request(app, client, "metric-graph.figure", [metric, search, [], None, None, None]),
+            lambda: dash_request(app, client, "over_time-avg-graph.figure", [metric, search]),
+            lambda: dash_request(app, client, "location_map.figure", [[], 0, search]),
+            lambda: dash_request(app, client, "nearest-locations-box.children", [0, [], search]),
+        ],
+        "comparison_10": [
+            lambda: dash_request(app, client, "comparison-graph.figure",
+                                 ["All", search, [], location_ids[1:10], metric, ["raw", "lowess"], None]),
+        ],
+    }
+
+    results = {"rows": len(app.samples), "sites": len(app.location_info), "scenarios": {}}
+    for mode, scenarios in (("direct", direct), ("http", http)):
+        size = payload_size if mode == "direct" else len
+        for name, calls in scenarios.items():
+            results["scenarios"][f"{mode}/{name}"] = measure(calls, repeat, size, app.clear_result_caches)
+    # Whole-process peak, dataset included (kilobytes on Linux)
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+
+def check(results, baselines):
+    # Regressions: any tracked number above baseline * (1 + tolerance), and
+    # scenarios without a baseline
+    failures = []
+    for scale, result in results.items():
+        for scenario, numbers in result["scenarios"].items():
+            base = baselines.get(f"{scale}/{scenario}")
+            if base is None:
+                failures.append(f"{scale} {scenario}: no baseline (record one with --update-baselines)")
+                continue
+            for key, tolerance in TOLERANCE.items():
+                if numbers[key] > base[key] * (1 + tolerance):
+                    failures.append(f"{scale} {scenario} {key}: {numbers[key]} > baseline {base[key]}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="*", default=[1])
+    parser.add_argument("--dataset", nargs="*", default=[],
+                        help="also run against these sample tables (baselines keyed by file name)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "wqd-bench"),
+                        help="where scaled datasets are built and kept between runs")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        json.dump(run_scenarios(args.repeat), sys.stdout)
+        return
+
+    runs = [(f"{factor}x", workdir_for(factor, args.data_dir), {}) for factor in args.scales]
+    runs += [(Path(path).name, ROOT, {"DATASET_PATH": str(Path(path).resolve())}) for path in args.dataset]
+    results = {}
+    for label, workdir, extra_env in runs:
+        env = {**os.environ, "FIGURE_CACHE_MB": "0", "SHARED_CACHE_PATH": "", "METRICS_DIR": "", **extra_env}
+        out = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--run", "--repeat", str(args.repeat)],
+            cwd=workdir, env=env, check=True, capture_output=True, text=True,
+        )
+        results[label] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{'data':>14} {'scenario':<22} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p50 rel':>8} "
+          f"{'peak MB':>8} {'payload KB':>11}")
+    for label, result in results.items():
+        print(f"{label:>14} {result['rows']} rows, {result['sites']} sites, max RSS {result['max_rss_mb']} MB")
+        for scenario, n in result["scenarios"].items():
+            print(f"{label:>14} {scenario:<22} {n['calls']:>6} {n['p50_ms']:>9.2f} {n['p95_ms']:>9.2f} {n['p50_rel']:>8.2f} "
+                  f"{n['peak_mb']:>8.1f} {n['payload_bytes'] / 1024:>11.1f}")
+
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    if args.update_baselines:
+        for label, result in results.items():
+            for scenario, numbers in result["scenarios"].items():
+                baselines[f"{label}/{scenario}"] = {key: numbers[key] for key in TOLERANCE}
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"baselines written to {BASELINES}")
+        return
+
+    failures = check(results, baselines)
+    for failure in failures:
+        print("REGRESSION", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
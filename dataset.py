@@ -0,0 +1,726 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+cols = [
+    'Orthophosphate, reactive as P (mg/l)', 'Temperature of Water (°C)',
+    'Ammoniacal Nitrogen as N (mg/l)', 'Phosphorus, Total as P (mg/l)',
+    'Nitrogen, Total Oxidised as N (mg/l)', 'Nitrate as N (mg/l)',
+    'Nitrite as N (mg/l)', 'Nitrogen, Total as N (mg/l)',
+    'Alkalinity to pH 4.5 as CaCO3 (mg/l)', 'pH (phunits)',
+    'Oxygen, Dissolved, % Saturation (%)', 'Oxygen, Dissolved as O2 (mg/l)',
+    'BOD : 5 Day ATU (mg/l)', 'Solids, Suspended at 105 C (mg/l)'
+]
+
+SOURCE_PATH = "mappable.parquet"
+SERVING_DIR = "serving"
+MANIFEST = "manifest.json"
+# Bump when the layout of the serving tables changes
+SERVING_FORMAT = 7
+# Rows per parquet row group in serving/samples.parquet. The file is sorted by
+# Location_ID then Date, so smaller groups let a location read skip more of the file.
+SAMPLES_ROW_GROUP = 8192
+# Memory-mappable copy of the sample table shared by all workers
+SAMPLES_ARROW = "samples.arrow"
+# Sample batches appended since the last build (see append_batch)
+FRAGMENTS_DIR = "fragments"
+# Optional hive-partitioned copy of the sample table (build --partitioned):
+# PARTITIONS_DIR/<version>-<suffix>/Year=YYYY/part-0.parquet, a new directory per build
+PARTITIONS_DIR = "partitions"
+PARTITIONING = ds.partitioning(pa.schema([("Year", pa.int16())]), flavor="hive")
+# Rows per row group inside each year. A year holds every location, so a
+# location read takes one group per year and smaller groups mean less to skip
+# past; much smaller and whole-column reads slow down.
+PARTITION_ROW_GROUP = 2048
+
+
+# Test types a Test_Type_bits mask can hold (int64, sign bit unused)
+MAX_TEST_TYPES = 63
+
+# Columns every sample table must have, beyond the metrics and their companions
+KEY_COLUMNS = ["Location_ID", "Location_Name", "Longitude", "Latitude", "Date", "Year", "Month", "Test_Type", "Sample_Count"]
+CATEGORY_COLUMNS = ["Location_ID", "Location_Name", "Test_Type", "Region"]
+
+
+def compact_schema(frame):
+    # Check the sample table has the expected columns and convert it to the
+    # in-memory schema: categorical string keys, small integer Year/Month/counts,
+    # float32 metrics, plain bool flags, categorical cluster labels and a parsed
+    # datetime64 Date. Coordinates stay float64 as they are displayed as-is.
+    required = KEY_COLUMNS + cols + [f"{col}_flagged" for col in cols]
+    missing = [c for c in required if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Sample table is missing columns: {missing}")
+
+    before = frame.memory_usage(deep=True).sum()
+    dtypes = {"Date": "datetime64[ns]", "Year": np.int16, "Month": np.int8, "Sample_Count": np.int32}
+    for c in ("Easting", "Northing"):
+        if c in frame.columns:
+            dtypes[c] = np.int32
+    for c in CATEGORY_COLUMNS:
+        if c in frame.columns:
+            dtypes[c] = "category"
+    for c in frame.columns:
+        if c.endswith(("_shape_yearly", "_shape_over-time")):
+            dtypes[c] = "category"
+        elif frame[c].dtype == np.float64 and c not in ("Longitude", "Latitude"):
+            dtypes[c] = np.float32
+    frame = frame.astype(dtypes)
+    for col in cols:
+        flag = f"{col}_flagged"
+        if frame[flag].dtype != bool:
+            frame[flag] = frame[flag].fillna(False).astype(bool)
+
+    after = frame.memory_usage(deep=True).sum()
+    print(f"Sample table: {len(frame)} rows, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+    return frame
+
+
+def test_type_counts(frame):
+    # Split comma-separated test types, trim, and count by frequency
+    split_test_types = frame['Test_Type'].dropna().str.lower().str.split(',').explode()
+    split_test_types = split_test_types.str.strip()
+    return pd.DataFrame(Counter(split_test_types).most_common(), columns=["Test_Type", "count"])
+
+
+def encode_test_types(series, test_types_x):
+    # Encode each comma-separated Test_Type string as an int64 bitmask over
+    # test_types_x (bit i set = contains test_types_x[i]). Only the distinct
+    # strings are parsed; missing values encode to 0.
+    if len(test_types_x) > MAX_TEST_TYPES:
+        raise ValueError(
+            f"{len(test_types_x)} distinct test types; the Test_Type_bits masks hold at most {MAX_TEST_TYPES}"
+        )
+    index = {t: i for i, t in enumerate(test_types_x)}
+    codes, uniques = pd.factorize(series)
+    bits = [
+        sum(1 << index[t] for t in {p.strip() for p in u.lower().split(',')} if t in index)
+        for u in uniques
+    ]
+    return np.append(np.array(bits, dtype=np.int64), 0)[codes]
+
+
+def location_offsets(frame):
+    # start/stop row offsets per Location_ID for a frame already sorted by it
+    ids = frame["Location_ID"].to_numpy()
+    if len(ids) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    stops = np.r_[starts[1:], len(ids)]
+    return {ids[s]: (s, e) for s, e in zip(starts, stops)}
+
+
+def build_location_index(frame):
+    # Sort once so each location's rows are contiguous (stable, so the original
+    # row order within a location is kept), then record start/stop offsets
+    frame = frame.sort_values("Location_ID", kind="stable").reset_index(drop=True)
+    return frame, location_offsets(frame)
+
+
+def sort_location_dates(frame):
+    # Order each location's block by Date (stable, so same-day samples keep
+    # their source order); callbacks then binary-search date ranges and never sort
+    return frame.sort_values(["Location_ID", "Date"], kind="stable").reset_index(drop=True)
+
+
+def build_location_info(frame):
+    return frame.groupby("Location_ID", observed=True).agg({
+        "Location_Name": "first",
+        "Longitude": "first",
+        "Latitude": "first",
+        "Sample_Count":"first",
+        "Test_Type": lambda x: ", ".join(sorted(set(x.dropna()))),
+        "Test_Type_bits": np.bitwise_or.reduce
+    }).reset_index()
+
+
+def build_location_test_types(frame):
+    # First row of each (location, whole Test_Type string lowercased/stripped),
+    # in row order: the label a location is counted under in the cluster tables
+    rows = frame.loc[frame['Test_Type'].notna(), ['Location_ID', 'Test_Type']].astype(str)
+    rows['Test_Type_clean'] = rows['Test_Type'].str.lower().str.strip()
+    return rows.drop_duplicates(['Location_ID', 'Test_Type_clean']).reset_index(drop=True)
+
+
+def build_location_clusters(frame):
+    # K-means shape cluster label of every location for each metric
+    shape_cols = [c for c in frame.columns if c.endswith(("_shape_yearly", "_shape_over-time"))]
+    clusters = frame.groupby("Location_ID", observed=True)[shape_cols].first().astype(object)
+    clusters.index = clusters.index.astype(str)
+    return clusters
+
+
+def build_map_cube(frame, period):
+    # Unflagged sum and count of every parameter per (period, location, test type,
+    # sample count). Keeping sums rather than means lets any test-type / sample
+    # count selection be combined exactly by adding rows together.
+    keys = [period, "Location_ID", "Test_Type_bits", "Sample_Count"]
+    values = pd.DataFrame({col: frame[col].astype(np.float64).where(~frame[f"{col}_flagged"]) for col in cols})
+    values[keys] = frame[keys]
+    grouped = values.groupby(keys, dropna=False, observed=True)[cols]
+    return grouped.sum(), grouped.count()
+
+
+def compute_colour_range(frame, col, bits=0):
+    # 5th-95th percentile of all unflagged values, optionally only rows whose
+    # test types intersect the bitmask
+    all_unflagged = frame[~frame[f"{col}_flagged"]]
+    if bits:
+        all_unflagged = all_unflagged[(all_unflagged['Test_Type_bits'] & bits) != 0]
+
+    temp_min = all_unflagged[col].quantile(0.05)
+    temp_max = all_unflagged[col].quantile(0.95)
+
+    # Avoid identical values
+    if temp_min == temp_max:
+        temp_min -= 0.1
+        temp_max += 0.1
+    return temp_min, temp_max
+
+
+def recount_samples(rows):
+    # Sample_Count from the rows themselves, for reads that include appended
+    # fragments: rows written before an append keep the count from before it.
+    # Every row of each location in `rows` must be present.
+    if len(rows) and {"Location_ID", "Sample_Count"} <= set(rows.columns):
+        rows["Sample_Count"] = rows.groupby("Location_ID", observed=True)["Location_ID"].transform("size").astype(np.int32)
+    return rows
+
+
+def counted_columns(columns):
+    # Columns to read so recount_samples can work on a projection
+    if columns is not None and "Sample_Count" in columns and "Location_ID" not in columns:
+        return [*columns, "Location_ID"]
+    return columns
+
+
+class FrameSamples:
+    # Sample table held in memory, sorted by Location_ID then Date. Batches
+    # appended since the last build are kept as a second, much smaller table
+    # sorted the same way; a location's rows from both are merged on read.
+
+    def __init__(self, frame, appended=None, base=None, location_cache=256):
+        self.frame = frame
+        self.offsets = location_offsets(frame)
+        self.appended = appended if appended is not None and len(appended) else None
+        self.appended_offsets = location_offsets(self.appended) if self.appended is not None else {}
+        self.columns = frame.columns
+        # Identifies the serving build the base frame came from (see load_tables)
+        self.base = base
+        self.merged_rows = lru_cache(maxsize=location_cache)(self._merge_location)
+
+    def __len__(self):
+        return len(self.frame) + (len(self.appended) if self.appended is not None else 0)
+
+    def load(self, columns):
+        if self.appended is None:
+            return self.frame[columns]
+        wanted = counted_columns(columns)
+        return recount_samples(pd.concat([self.frame[wanted], self.appended[wanted]], ignore_index=True))[columns]
+
+    def _base_rows(self, location_id):
+        # O(1) slice of the presorted frame instead of a full-table boolean mask
+        bounds = self.offsets.get(location_id)
+        if bounds is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[bounds[0]:bounds[1]]
+
+    def _merge_location(self, location_id):
+        start, stop = self.appended_offsets[location_id]
+        rows = self.appended.iloc[start:stop]
+        if location_id in self.offsets:
+            rows = pd.concat([self._base_rows(location_id), rows], ignore_index=True)
+        return recount_samples(rows.sort_values("Date", kind="stable", ignore_index=True))
+
+    def location_rows(self, location_id):
+        if location_id in self.appended_offsets:
+            return self.merged_rows(location_id)
+        return self._base_rows(location_id)
+
+    def locations_rows(self, location_ids, columns=None):
+        # Rows of several locations in one take, grouped by location in the
+        # order given
+        location_ids = list(dict.fromkeys(location_ids))
+        if any(i in self.appended_offsets for i in location_ids):
+            parts = [self.location_rows(i) for i in location_ids]
+            rows = pd.concat(parts, ignore_index=True) if parts else self.frame.iloc[0:0]
+            return rows if columns is None else rows[columns]
+        bounds = [self.offsets[i] for i in location_ids if i in self.offsets]
+        positions = np.concatenate([np.arange(s, e) for s, e in bounds]) if bounds else np.array([], dtype=int)
+        # Rows and columns in one take, so only the selected cells are copied
+        if columns is None:
+            return self.frame.iloc[positions]
+        return self.frame.iloc[positions, self.frame.columns.get_indexer(columns)]
+
+
+class ParquetSamples:
+    # Sample table left on disk and read on first use: whole columns only when
+    # a callback asks for them, and a location's rows via row-group pruning
+
+    def __init__(self, path, fragments=(), location_cache=64):
+        # Appended fragments are read together with the main file
+        self.path = [path, *fragments] if fragments else path
+        self.fragments = list(fragments)
+        metadata = pq.read_metadata(path)
+        self.schema = metadata.schema.to_arrow_schema()
+        self.columns = pd.Index([c for c in self.schema.names if not c.startswith("__index_level_")])
+        self.num_rows = metadata.num_rows + sum(pq.read_metadata(f).num_rows for f in fragments)
+        # Single file already in Location_ID, Date order
+        self.sorted = not fragments
+        self.location_rows = lru_cache(maxsize=location_cache)(self._read_location)
+
+    def __len__(self):
+        return self.num_rows
+
+    def read(self, columns=None, filters=None):
+        # Projected, filtered read, e.g. filters=[("Year", "==", 2015)]
+        return restore_categories(pq.read_table(self.path, columns=columns, filters=filters).to_pandas(), self.schema)
+
+    def load(self, columns):
+        # Whole-table columns, read from disk on every call rather than kept,
+        # so lazy mode doesn't end up holding the table; prefer a filtered read
+        if not self.fragments:
+            return self.read(columns)
+        return recount_samples(self.read(counted_columns(columns)))[columns]
+
+    def _read_location(self, location_id):
+        rows = self.read(filters=[("Location_ID", "==", location_id)])
+        if self.fragments:
+            rows = recount_samples(rows)
+        return rows if self.sorted else rows.sort_values("Date", kind="stable", ignore_index=True)
+
+    def locations_rows(self, location_ids, columns=None):
+        # Rows of several locations in one pruned read, grouped by location
+        wanted = counted_columns(columns) if self.fragments else columns
+        rows = self.read(wanted, filters=[("Location_ID", "in", list(dict.fromkeys(location_ids)))])
+        if self.fragments:
+            rows = recount_samples(rows)
+        if not self.sorted and {"Location_ID", "Date"} <= set(rows.columns):
+            rows = sort_location_dates(rows)
+        return rows if wanted is columns else rows[columns]
+
+
+class PartitionedSamples(ParquetSamples):
+    # Sample table as a hive-partitioned directory (Year=YYYY/, each year sorted
+    # by Location_ID then Date), read through pyarrow.dataset. A Year filter
+    # only opens that year's files and a Location_ID filter skips row groups
+    # within each year, so a read touches the partitions it needs and nothing
+    # has to fit in memory beyond what callbacks ask for.
+
+    def __init__(self, path, fragments=(), location_cache=64):
+        dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+        if fragments:
+            # Fragments are read with the partitions' schema, in which Year
+            # comes from the directory name
+            dataset = ds.dataset([dataset, ds.dataset(list(fragments), format="parquet", schema=dataset.schema)])
+        self.dataset = dataset
+        self.path = path
+        self.fragments = list(fragments)
+        # Source column order from the pandas metadata (the partition column
+        # otherwise comes last)
+        self.schema = dataset.schema
+        names = self.schema.names
+        order = [c["name"] for c in (self.schema.pandas_metadata or {}).get("columns", []) if c["name"] in names]
+        self.columns = pd.Index(order + [c for c in names if c not in order])
+        self.num_rows = dataset.count_rows()
+        # Years come back one partition after another
+        self.sorted = False
+        self.location_rows = lru_cache(maxsize=location_cache)(self._read_location)
+
+    def read(self, columns=None, filters=None):
+        expression = pq.filters_to_expression(filters) if filters else None
+        table = self.dataset.to_table(columns=list(self.columns) if columns is None else columns, filter=expression)
+        return restore_categories(table.to_pandas(), self.schema)
+
+
+def write_arrow(frame, path):
+    # Uncompressed Arrow IPC file so it can be memory-mapped. Numeric columns
+    # keep NaN as a value rather than a null, which lets to_pandas() return
+    # views of the mapping instead of copies.
+    arrays = {
+        c: pa.array(frame[c].to_numpy(), from_pandas=False) if frame[c].dtype.kind in "fiu" else pa.Array.from_pandas(frame[c])
+        for c in frame.columns
+    }
+    table = pa.table(arrays)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def read_arrow_mapped(path):
+    # Numeric columns come back as read-only views of the mapped file, so every
+    # worker shares the same physical pages through the OS page cache. Other
+    # columns are still materialised per process.
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def derive_tables(frame):
+    # Every table the app serves from, derived from the raw sample table
+    frame = compact_schema(frame)
+    test_types = test_type_counts(frame)
+    frame['Test_Type_bits'] = encode_test_types(frame['Test_Type'], list(test_types["Test_Type"]))
+    frame, _ = build_location_index(frame)
+
+    # Derived tables use the source's row order within a location ("first"
+    # name/coordinates/test type); only the served samples are date-sorted
+    tables = {
+        "samples": sort_location_dates(frame),
+        "test_types": test_types,
+        "location_info": build_location_info(frame),
+        "location_test_types": build_location_test_types(frame),
+        "location_clusters": build_location_clusters(frame),
+        "colour_ranges": pd.DataFrame(
+            [compute_colour_range(frame, col) for col in cols], index=cols, columns=["min", "max"]
+        ),
+    }
+    for period in ("Year", "Month"):
+        tables[f"map_cube_{period}_sum"], tables[f"map_cube_{period}_count"] = build_map_cube(frame, period)
+    return tables
+
+
+def file_version(path):
+    # Content hash of the source file, used as the dataset version
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def replace_file(path, write):
+    # Write beside the target and rename over it, so a running app (which may
+    # have the old file open or memory-mapped) never reads a partly written one
+    write(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def plain_strings(table):
+    # Categorical columns as plain strings: pyarrow only prunes row groups on
+    # the statistics of non-dictionary columns, so a Location_ID filter on a
+    # dictionary-encoded file reads every group. The pandas metadata still
+    # records them as categorical for restore_categories.
+    return table.cast(pa.schema([
+        f.with_type(f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in table.schema
+    ], metadata=table.schema.metadata))
+
+
+def restore_categories(frame, schema):
+    # Turn the columns plain_strings stored as strings back into categoricals
+    for c in (schema.pandas_metadata or {}).get("columns", []):
+        if c["pandas_type"] == "categorical" and c["name"] in frame.columns and frame[c["name"]].dtype != "category":
+            frame[c["name"]] = frame[c["name"]].astype("category")
+    return frame
+
+
+def write_samples(frame, path):
+    # samples.parquet and fragments, in row groups of SAMPLES_ROW_GROUP
+    table = plain_strings(pa.Table.from_pandas(frame, preserve_index=False))
+    pq.write_table(table, path, row_group_size=SAMPLES_ROW_GROUP)
+
+
+def read_samples(path):
+    table = pq.read_table(path)
+    return restore_categories(table.to_pandas(), table.schema)
+
+
+def write_partitioned(frame, path):
+    # One Year=YYYY/ directory per year under path (a new, empty directory),
+    # keeping the Location_ID then Date order inside each so location reads
+    # can skip row groups
+    table = plain_strings(pa.Table.from_pandas(frame.sort_values("Year", kind="stable"), preserve_index=False))
+    ds.write_dataset(table, path, format="parquet", partitioning=PARTITIONING,
+                     max_rows_per_group=PARTITION_ROW_GROUP, preserve_order=True, basename_template="part-{i}.parquet")
+
+
+def write_tables(tables, out_dir, manifest):
+    # Derived tables other than the samples, recorded in the manifest
+    for name, table in tables.items():
+        filename = f"{name}.parquet"
+        replace_file(os.path.join(out_dir, filename), table.to_parquet)
+        manifest["tables"][name] = {"file": filename, "rows": len(table)}
+
+
+def write_manifest(manifest, out_dir):
+    # Written last, so a half-written directory is never picked up
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    replace_file(os.path.join(out_dir, MANIFEST), write)
+
+
+def read_fragments(out_dir, manifest):
+    paths = [os.path.join(out_dir, f["file"]) for f in manifest.get("fragments", [])]
+    if not paths:
+        return None
+    return sort_location_dates(pd.concat([read_samples(p) for p in paths], ignore_index=True))
+
+
+def remove_stale_fragments(out_dir, manifest):
+    # Fragment files the manifest no longer lists (folded in by a build). They
+    # are only removed on the next build or append, by which time running
+    # workers have reloaded and stopped reading them.
+    listed = {os.path.basename(f["file"]) for f in manifest.get("fragments", [])}
+    directory = os.path.join(out_dir, FRAGMENTS_DIR)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name not in listed:
+                os.remove(os.path.join(directory, name))
+
+
+def remove_stale_partitions(out_dir, manifest, previous=None):
+    # Partitioned copies other than the current and previous builds'. Like
+    # stale fragments, a build's copy is only removed on the build after
+    # next, by which time running workers have reloaded and stopped reading it.
+    keep = {m["tables"]["samples"].get("partitions") for m in (manifest, previous) if m}
+    directory = os.path.join(out_dir, PARTITIONS_DIR)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if os.path.join(PARTITIONS_DIR, name) not in keep:
+                shutil.rmtree(os.path.join(directory, name))
+
+
+def build_serving(source=SOURCE_PATH, out_dir=SERVING_DIR, partitioned=False):
+    # Write every derived table to out_dir plus a manifest recording the version.
+    # Batches appended to a build of the same source are folded into the new
+    # base tables; a different source file starts afresh. partitioned also
+    # writes the samples as a Year-partitioned dataset for lazy serving.
+    os.makedirs(out_dir, exist_ok=True)
+    version = file_version(source)
+    frame = pd.read_parquet(source)
+    previous = read_manifest(out_dir)
+    if previous and previous.get("fragments") and previous["source_version"] == version:
+        appended = read_fragments(out_dir, previous)
+        frame = pd.concat([compact_schema(frame), appended[frame.columns]], ignore_index=True)
+        frame["Sample_Count"] = frame.groupby("Location_ID", observed=True)["Location_ID"].transform("size")
+        # Same data as before, but a new version so running workers reload
+        # onto the new base and stop reading the old fragments
+        version = hashlib.sha256(f"{previous['version']}:compacted".encode()).hexdigest()[:16]
+    tables = derive_tables(frame)
+    manifest = {
+        "format": SERVING_FORMAT,
+        "version": version,
+        "source_version": file_version(source),
+        "source": os.path.basename(source),
+        "built_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "tables": {},
+        "fragments": [],
+    }
+    samples = tables.pop("samples")
+    write_tables(tables, out_dir, manifest)
+    replace_file(os.path.join(out_dir, "samples.parquet"), lambda path: write_samples(samples, path))
+    replace_file(os.path.join(out_dir, SAMPLES_ARROW), lambda path: write_arrow(samples, path))
+    manifest["tables"]["samples"] = {"file": "samples.parquet", "rows": len(samples), "arrow": SAMPLES_ARROW}
+    if partitioned:
+        # A fresh directory even when the version is unchanged, so the copy a
+        # running worker is reading is never overwritten
+        os.makedirs(os.path.join(out_dir, PARTITIONS_DIR), exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f"{version}-", dir=os.path.join(out_dir, PARTITIONS_DIR))
+        os.chmod(path, 0o755)
+        write_partitioned(samples, path)
+        manifest["tables"]["samples"]["partitions"] = os.path.join(PARTITIONS_DIR, os.path.basename(path))
+    write_manifest(manifest, out_dir)
+    if previous:
+        # Only fragments the previous build already folded in; the ones folded
+        # in now may still be read by workers that haven't reloaded yet
+        remove_stale_fragments(out_dir, previous)
+    remove_stale_partitions(out_dir, manifest, previous)
+    return manifest
+
+
+def append_batch(batch, out_dir=SERVING_DIR):
+    # Add new samples to the serving tables without rebuilding them. The batch
+    # is written as a fragment next to samples.parquet, and the derived tables
+    # are updated only for the locations it touches, so the cost follows the
+    # batch size rather than the history. Test types keep their bit positions
+    # (new ones are added at the end) and colour ranges are left as they are;
+    # the next build recomputes both exactly. Flag and shape columns missing
+    # from the batch default to unflagged and to the location's current
+    # cluster labels. Rows already on disk keep their old Sample_Count; the
+    # sample readers recount locations whenever fragments are merged in.
+    # Returns the new manifest.
+    manifest = read_manifest(out_dir)
+    if manifest is None:
+        raise ValueError(f"No current serving tables in {out_dir}; run `python dataset.py build` first")
+    digest = hashlib.sha256(pd.util.hash_pandas_object(batch, index=False).to_numpy().tobytes()).hexdigest()[:16]
+    if any(f["digest"] == digest for f in manifest["fragments"]):
+        print(f"Batch {digest} is already appended")
+        return manifest
+    remove_stale_fragments(out_dir, manifest)
+    tables = {
+        name: pd.read_parquet(os.path.join(out_dir, entry["file"]))
+        for name, entry in manifest["tables"].items() if name != "samples"
+    }
+    samples_path = os.path.join(out_dir, manifest["tables"]["samples"]["file"])
+    schema = pq.read_schema(samples_path)
+    sample_dtypes = restore_categories(schema.empty_table().to_pandas(), schema).dtypes
+
+    batch = batch.copy()
+    clusters = tables["location_clusters"]
+    for col in cols:
+        if f"{col}_flagged" not in batch.columns:
+            batch[f"{col}_flagged"] = False
+    for c in clusters.columns:
+        if c not in batch.columns:
+            batch[c] = batch["Location_ID"].astype(str).map(clusters[c]).fillna("Unidentified")
+    batch["Sample_Count"] = 0
+    batch = compact_schema(batch)
+
+    # Test types: counts updated, bit positions kept
+    old_types = tables["test_types"]
+    counts = test_type_counts(batch)
+    order = list(old_types["Test_Type"]) + [t for t in counts["Test_Type"] if t not in set(old_types["Test_Type"])]
+    totals = old_types.set_index("Test_Type")["count"].add(counts.set_index("Test_Type")["count"], fill_value=0)
+    tables["test_types"] = pd.DataFrame({"Test_Type": order, "count": totals[order].astype(np.int64).to_numpy()})
+    batch["Test_Type_bits"] = encode_test_types(batch["Test_Type"], order)
+
+    # Location info of the affected locations; existing ones keep their first
+    # name/coordinates and gain the batch's samples and test types
+    batch["Location_ID"] = batch["Location_ID"].astype(str)
+    info = tables["location_info"].astype({"Location_ID": str, "Location_Name": object}).set_index("Location_ID")
+    added = build_location_info(batch).astype({"Location_Name": object, "Test_Type": object}).set_index("Location_ID")
+    old = info.reindex(added.index)
+    known = old["Sample_Count"].notna()
+    added.loc[known, ["Location_Name", "Longitude", "Latitude"]] = old.loc[known, ["Location_Name", "Longitude", "Latitude"]]
+    added["Sample_Count"] = (old["Sample_Count"].fillna(0) + batch.groupby("Location_ID").size()).astype(np.int32)
+    added.loc[known, "Test_Type"] = [
+        ", ".join(sorted(set(a.split(", ")) | set(b.split(", ")) - {""}))
+        for a, b in zip(old.loc[known, "Test_Type"], added.loc[known, "Test_Type"])
+    ]
+    added.loc[known, "Test_Type_bits"] |= old.loc[known, "Test_Type_bits"].astype(np.int64)
+    info = pd.concat([info[~info.index.isin(added.index)], added]).sort_index()
+    tables["location_info"] = info.reset_index().astype({"Location_ID": "category", "Location_Name": "category"})
+    sample_count = added["Sample_Count"]
+    batch["Sample_Count"] = batch["Location_ID"].map(sample_count).astype(np.int32)
+
+    # New (location, test type) pairs and new locations' cluster labels
+    tables["location_test_types"] = pd.concat(
+        [tables["location_test_types"], build_location_test_types(batch)], ignore_index=True
+    ).drop_duplicates(["Location_ID", "Test_Type_clean"]).reset_index(drop=True)
+    new_clusters = build_location_clusters(batch)
+    tables["location_clusters"] = pd.concat([clusters, new_clusters[~new_clusters.index.isin(clusters.index)]])
+
+    # Map cubes: the affected locations' cells move to their new sample count
+    # and the batch's sums and counts are added in
+    for period in ("Year", "Month"):
+        batch_sum, batch_count = build_map_cube(batch, period)
+        for kind, addition in (("sum", batch_sum), ("count", batch_count)):
+            cube = tables[f"map_cube_{period}_{kind}"]
+            keys = cube.index.to_frame(index=False)
+            keys["Location_ID"] = keys["Location_ID"].astype(str)
+            affected = keys["Location_ID"].isin(sample_count.index).to_numpy()
+            moved = cube[affected].copy()
+            moved_keys = keys[affected].copy()
+            moved_keys["Sample_Count"] = moved_keys["Location_ID"].map(sample_count).astype(np.int32)
+            moved.index = pd.MultiIndex.from_frame(moved_keys)
+            addition = addition.copy()
+            addition.index = pd.MultiIndex.from_frame(addition.index.to_frame(index=False).astype({"Location_ID": str}))
+            merged = pd.concat([moved, addition]).groupby(level=list(keys.columns), observed=True).sum()
+            kept = cube[~affected].copy()
+            kept.index = pd.MultiIndex.from_frame(keys[~affected])
+            tables[f"map_cube_{period}_{kind}"] = pd.concat([kept, merged]).astype(cube.dtypes).sort_index()
+
+    # The fragment, with the same columns and dtypes as samples.parquet
+    fragment = sort_location_dates(batch).reindex(columns=sample_dtypes.index)
+    fragment = fragment.astype({c: t for c, t in sample_dtypes.items() if not isinstance(t, pd.CategoricalDtype)})
+    os.makedirs(os.path.join(out_dir, FRAGMENTS_DIR), exist_ok=True)
+    filename = os.path.join(FRAGMENTS_DIR, f"{len(manifest['fragments']) + 1:05d}-{digest}.parquet")
+    replace_file(os.path.join(out_dir, filename), lambda path: write_samples(fragment, path))
+
+    manifest["version"] = hashlib.sha256(f"{manifest['version']}:{digest}".encode()).hexdigest()[:16]
+    manifest["fragments"].append({
+        "file": filename, "rows": len(fragment), "digest": digest, "locations": len(sample_count),
+        "appended_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    })
+    samples_entry = manifest["tables"].pop("samples")
+    write_tables(tables, out_dir, manifest)
+    manifest["tables"]["samples"] = samples_entry
+    write_manifest(manifest, out_dir)
+    print(f"Appended {len(fragment)} rows over {len(sample_count)} locations as {filename}")
+    return manifest
+
+
+def read_manifest(out_dir=SERVING_DIR):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    return manifest if manifest.get("format") == SERVING_FORMAT else None
+
+
+def load_tables(source=SOURCE_PATH, out_dir=SERVING_DIR, lazy=False, mmap=False, previous=None):
+    # Serving tables when the serving directory is current for the source file
+    # (or the source isn't deployed at all); otherwise derive them in-process.
+    # tables["samples"] is a FrameSamples (over the memory-mapped Arrow copy
+    # when mmap), or when lazy a PartitionedSamples if the build wrote
+    # partitions and a ParquetSamples otherwise, plus any appended fragments.
+    # `previous` is the samples of an earlier load: when only batches have been
+    # appended since, its base table is reused and just the fragments are read.
+    # Returns (tables, version).
+    manifest = read_manifest(out_dir)
+    source_exists = os.path.exists(source)
+    if manifest and (not source_exists or manifest["source_version"] == file_version(source)):
+        tables = {}
+        base = (os.path.abspath(out_dir), manifest["built_at"], "mmap" if mmap else "frame")
+        for name, entry in manifest["tables"].items():
+            path = os.path.join(out_dir, entry["file"])
+            if name == "samples" and lazy:
+                fragments = [os.path.join(out_dir, f["file"]) for f in manifest["fragments"]]
+                if "partitions" in entry:
+                    tables[name] = PartitionedSamples(os.path.join(out_dir, entry["partitions"]), fragments)
+                else:
+                    tables[name] = ParquetSamples(path, fragments)
+            elif name == "samples" and getattr(previous, "base", None) == base:
+                tables[name] = FrameSamples(previous.frame, read_fragments(out_dir, manifest), base)
+            elif name == "samples" and mmap and "arrow" in entry:
+                frame = read_arrow_mapped(os.path.join(out_dir, entry["arrow"]))
+                tables[name] = FrameSamples(frame, read_fragments(out_dir, manifest), base)
+            elif name == "samples":
+                tables[name] = FrameSamples(read_samples(path), read_fragments(out_dir, manifest), base)
+            else:
+                tables[name] = pd.read_parquet(path)
+        return tables, manifest["version"]
+
+    if manifest:
+        print(f"Serving tables in {out_dir} are stale for {source}; deriving in-process")
+    if lazy or mmap:
+        print(f"No current serving tables in {out_dir}; {'lazy' if lazy else 'memory-mapped'} sample access "
+              f"needs `python dataset.py build`, holding the samples in memory instead")
+    tables = derive_tables(pd.read_parquet(source))
+    tables["samples"] = FrameSamples(tables["samples"])
+    return tables, file_version(source)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the dashboard's serving tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="read the source parquet and write the serving tables")
+    build.add_argument("--source", default=SOURCE_PATH)
+    build.add_argument("--out", default=SERVING_DIR)
+    build.add_argument("--partitioned", action="store_true",
+                       help="also write the samples partitioned by Year, read with pruning when LAZY_SAMPLES=1")
+    append = sub.add_parser("append", help="add a parquet batch of new samples to the serving tables")
+    append.add_argument("batch")
+    append.add_argument("--out", default=SERVING_DIR)
+    args = parser.parse_args()
+
+    if args.command == "append":
+        manifest = append_batch(pd.read_parquet(args.batch), args.out)
+        print(f"version {manifest['version']}, {len(manifest['fragments'])} fragments since the last build")
+    elif args.command == "build":
+        manifest = build_serving(args.source, args.out, args.partitioned)
+        for name, entry in manifest["tables"].items():
+            print(f"{name:24} {entry['rows']:>10} rows")
+        print(f"version {manifest['version']} -> {args.out}/{MANIFEST}")
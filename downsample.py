@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keep the first and last points and, from
+    # each of n_out - 2 equal-count buckets in between, the point forming the
+    # largest triangle with the previously kept point and the next bucket's mean
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x = x[end:next_end].mean()
+        mean_y = y[end:next_end].mean()
+        area = np.abs((x[a] - mean_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def visible_rows(x, x_range):
+    # Positions of sorted x inside x_range, plus one neighbour either side so
+    # lines still run off the edges of the plot
+    lo = np.searchsorted(x, x_range[0], side="left")
+    hi = np.searchsorted(x, x_range[1], side="right")
+    return np.arange(max(lo - 1, 0), min(hi + 1, len(x)))
+
+
+def downsample(frame, x_col, y_col, n_out, keep=None, x_range=None):
+    # Rows of a date-sorted trace to draw: all of them when they fit in n_out,
+    # otherwise an LTTB selection; rows flagged in `keep` are always included.
+    # With x_range only the visible part is considered, so zooming in returns
+    # full resolution once the window holds n_out points or fewer.
+    dates = np.asarray(frame[x_col], dtype="datetime64[ns]")
+    positions = np.arange(len(frame))
+    if x_range is not None:
+        positions = visible_rows(dates, np.array(x_range, dtype="datetime64[ns]"))
+    if len(positions) > n_out:
+        picked = lttb_indices(dates[positions].astype(np.int64), frame[y_col].to_numpy(dtype=float)[positions], n_out)
+        chosen = positions[picked]
+        if keep is not None:
+            chosen = np.union1d(chosen, positions[np.asarray(keep, dtype=bool)[positions]])
+        positions = chosen
+    return frame.iloc[positions]
+
+
+def relayout_x_range(relayout_data):
+    # Visible x range from a graph's relayoutData: a (start, end) pair of
+    # Timestamps after a zoom/pan, "full" after autoscale, None when the event
+    # did not touch the x axis
+    if not relayout_data:
+        return None
+    if relayout_data.get("xaxis.autorange"):
+        return "full"
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        bounds = relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    elif "xaxis.range" in relayout_data:
+        bounds = relayout_data["xaxis.range"]
+    else:
+        return None
+    start, end = sorted(pd.Timestamp(b) for b in bounds)
+    return start, end
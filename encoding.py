@@ -0,0 +1,55 @@
+import base64
+
+import numpy as np
+
+# Trace attributes that may hold dates; their axis is forced to type "date"
+# because plotly.js cannot infer it from numbers
+DATE_AXES = {"x": "xaxis", "y": "yaxis"}
+
+
+def typed_array(values, dtype):
+    # plotly.js typed-array spec: base64 of the raw little-endian buffer
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"dtype": np.dtype(dtype).str[1:], "bdata": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def pack_value(value):
+    # Dates become float64 milliseconds since the epoch (what plotly.js uses
+    # internally for date axes), float64 arrays become float32; anything else
+    # is left for the JSON encoder. Returns (value, is_date)
+    if isinstance(value, dict) and value.get("dtype") == "f8" and "bdata" in value:
+        return typed_array(np.frombuffer(base64.b64decode(value["bdata"]), dtype="<f8"), "f4"), False
+    if not isinstance(value, np.ndarray) or value.ndim != 1:
+        return value, False
+    if np.issubdtype(value.dtype, np.datetime64):
+        ms = value.astype("datetime64[ns]").astype(np.int64) / 1e6
+        ms[np.isnat(value)] = np.nan
+        return typed_array(ms, "f8"), True
+    if value.dtype == np.float64:
+        return typed_array(value, "f4"), False
+    return value, False
+
+
+def pack_figure(figure):
+    # Opt-in compact wire format for a figure: large numeric and date arrays
+    # sent as base64 typed arrays (plotly.js >= 2.28) instead of JSON lists
+    if isinstance(figure, tuple):
+        return tuple(pack_figure(f) for f in figure)
+    if hasattr(figure, "to_plotly_json"):
+        figure = figure.to_plotly_json()
+    if not isinstance(figure, dict) or "data" not in figure:
+        return figure
+    layout = dict(figure.get("layout") or {})
+    data = []
+    for trace in figure["data"]:
+        trace = dict(trace)
+        for key, value in trace.items():
+            if key == "marker" and isinstance(value, dict):
+                trace[key] = {k: pack_value(v)[0] for k, v in value.items()}
+                continue
+            trace[key], is_date = pack_value(value)
+            if is_date and key in DATE_AXES:
+                axis = DATE_AXES[key] + trace.get(key + "axis", key)[1:]
+                layout[axis] = {**layout.get(axis, {}), "type": "date"}
+        data.append(trace)
+    return {**figure, "data": data, "layout": layout}
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from dash import no_update
+from plotly.io.json import to_json_plotly
+
+
+def freeze(value):
+    # Hashable, order-stable form of callback inputs (lists from dropdowns and
+    # checklists, dicts from stores) so equal inputs map to the same key
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def cache_key(name, args):
+    # Stable across processes (unlike hash()), so every worker finds the same entry
+    return hashlib.sha1(repr((name, freeze(args))).encode()).hexdigest()
+
+
+def payload(value):
+    # Plain JSON-ready form of a callback result; figures are stored as their
+    # plotly dict so hits skip rebuilding and validating the Figure object
+    if isinstance(value, tuple):
+        return tuple(payload(v) for v in value)
+    if hasattr(value, "to_plotly_json"):
+        return value.to_plotly_json()
+    return value
+
+
+class FigureCache:
+    # In-process LRU of callback results bounded by serialised size.
+    # Each entry records the dataset version it was built from; a hit is only
+    # served if that version is still current, so a dataset change
+    # invalidates everything without an explicit flush.
+    # An optional shared tier (shared_cache.DiskCache) is consulted on a miss
+    # and filled on every build, so other workers can reuse the result.
+    # `encode` turns a result into its stored/sent form (e.g. a binary payload).
+
+    def __init__(self, max_bytes, version=None, shared=None, encode=None):
+        self.max_bytes = max_bytes
+        self.version = version
+        self.encode = encode or payload
+        self.shared = shared if shared is not None and shared.enabled else None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.evictions = 0
+
+    def _count(self, name, outcome):
+        counts = self.counts.setdefault(name, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.size -= entry["bytes"]
+
+    def get(self, name, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["version"] != self.version:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self._count(name, "misses")
+                return None
+            self.entries.move_to_end(key)
+            self._count(name, "hits")
+            return entry
+
+    def put(self, key, value):
+        body = to_json_plotly(value).encode()
+        entry = {
+            "value": value,
+            "bytes": len(body),
+            "version": self.version,
+        }
+        if entry["bytes"] > self.max_bytes:
+            return entry
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = entry
+            self.size += entry["bytes"]
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def memoize(self, name, skip=None):
+        # Cache a callback's result on (name, normalised inputs). `skip` gets the
+        # same arguments and returns True for calls that must always run (e.g.
+        # ones that depend on which input triggered them)
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args):
+                if skip is not None and skip(*args):
+                    return func(*args)
+                key = (name, freeze(args))
+                entry = self.get(name, key)
+                if entry is not None:
+                    return entry["value"]
+                if self.shared is not None:
+                    shared_key = cache_key((name, self.encode.__name__), args)
+                    value = self.shared.get(shared_key)
+                    if value is not None:
+                        return self.put(key, value)["value"]
+                value = func(*args)
+                if value is no_update:
+                    return value
+                entry = self.put(key, self.encode(value))
+                if self.shared is not None:
+                    self.shared.put(shared_key, name, entry["value"])
+                return entry["value"]
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self.lock:
+            hits = sum(c["hits"] for c in self.counts.values())
+            misses = sum(c["misses"] for c in self.counts.values())
+            return {
+                "version": self.version,
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "callbacks": {name: dict(c) for name, c in sorted(self.counts.items())},
+            }
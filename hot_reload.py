@@ -0,0 +1,170 @@
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import jsonify, request
+
+# Reloading the dataset without restarting workers: a new snapshot is loaded
+# in a background thread while requests keep being served from the current
+# one, then swapped in between callbacks. A reload is started by a change to
+# one of the watched files (polled) or through the admin endpoint.
+
+
+class SwapGate:
+    # Callback requests enter and exit freely; a swap waits for the ones in
+    # flight to finish and holds new ones back until it is done, so no
+    # callback sees half of the old dataset and half of the new one
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.active = 0
+        self.swapping = False
+
+    def enter(self):
+        with self.cond:
+            self.cond.wait_for(lambda: not self.swapping)
+            self.active += 1
+
+    def exit(self):
+        with self.cond:
+            self.active -= 1
+            if not self.active:
+                self.cond.notify_all()
+
+    @contextmanager
+    def exclusive(self, timeout=30.0):
+        # After timeout the swap goes ahead anyway rather than wait on a stuck request
+        with self.cond:
+            self.swapping = True
+            self.cond.wait_for(lambda: not self.active, timeout)
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.swapping = False
+                self.cond.notify_all()
+
+
+def fingerprint(paths):
+    # (mtime, size) per path, None for a missing file
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+class DatasetReloader:
+    # load() returns (snapshot, version) and may take as long as it likes;
+    # apply(snapshot, version) must be quick and is run under the gate.
+    # Every worker process watches and reloads on its own.
+
+    def __init__(self, load, apply, version, watch=(), poll_seconds=0.0):
+        self.load = load
+        self.apply = apply
+        self.version = version
+        self.watch = list(watch)
+        self.poll_seconds = poll_seconds
+        self.gate = SwapGate()
+        self.lock = threading.Lock()
+        self.loading = False
+        self.reloads = 0
+        self.last_error = None
+        self.last_load_seconds = None
+        self.last_swap_ms = None
+        self.pid = None
+        self.seen = fingerprint(self.watch)
+
+    def request(self, force=False):
+        # Start a background reload unless one is already running
+        with self.lock:
+            if self.loading:
+                return False
+            self.loading = True
+        threading.Thread(target=self.reload, args=(force,), daemon=True, name="dataset-reload").start()
+        return True
+
+    def reload(self, force=False):
+        try:
+            started = time.perf_counter()
+            snapshot, version = self.load()
+            self.last_load_seconds = time.perf_counter() - started
+            if version != self.version or force:
+                started = time.perf_counter()
+                with self.gate.exclusive():
+                    self.apply(snapshot, version)
+                self.last_swap_ms = (time.perf_counter() - started) * 1000
+                self.version = version
+                self.reloads += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            with self.lock:
+                self.loading = False
+
+    def poll(self):
+        # A change is acted on once the files stop changing between two polls,
+        # so a file still being written is not read half-way
+        pending = None
+        while True:
+            time.sleep(self.poll_seconds)
+            current = fingerprint(self.watch)
+            if current == self.seen:
+                pending = None
+            elif current == pending and self.request():
+                self.seen = current
+            else:
+                pending = current
+
+    def start(self):
+        # Watcher thread per worker; threads don't survive gunicorn's fork, so
+        # this runs on a worker's first request rather than at import
+        if not self.poll_seconds or self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        threading.Thread(target=self.poll, daemon=True, name="dataset-watch").start()
+
+    def status(self):
+        return {
+            "version": self.version,
+            "loading": self.loading,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "last_load_seconds": self.last_load_seconds,
+            "last_swap_ms": self.last_swap_ms,
+            "watching": self.watch if self.poll_seconds else [],
+        }
+
+    def attach(self, server, path="/admin/reload", token=None):
+        # Gate the callback requests, start the watcher, and expose the status
+        # (GET) and a manual reload (POST, with an X-Reload-Token header). The
+        # endpoint only reaches the worker that serves it; others follow their
+        # watcher.
+        def before_request():
+            self.start()
+            if request.path.endswith("_dash-update-component"):
+                self.gate.enter()
+                request.environ["dataset.gated"] = True
+
+        def teardown_request(exc):
+            if request.environ.pop("dataset.gated", False):
+                self.gate.exit()
+
+        def reload():
+            if request.method == "POST":
+                supplied = request.headers.get("X-Reload-Token", "")
+                if not token or not hmac.compare_digest(supplied.encode(), token.encode()):
+                    return jsonify({"error": "forbidden"}), 403
+                started = self.request(force=request.args.get("force") == "1")
+                return jsonify({**self.status(), "started": started}), 202
+            return jsonify(self.status())
+
+        server.before_request(before_request)
+        server.teardown_request(teardown_request)
+        server.add_url_rule(path, "dataset_reload", reload, methods=["GET", "POST"])
@@ -0,0 +1,160 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+from flask import g, has_request_context, jsonify
+
+# Histogram upper bounds: callback/data/build times in ms, payloads in bytes
+TIME_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PAYLOAD_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+
+class Histogram:
+    # Fixed-bucket histogram; counts[i] holds observations <= bounds[i], the
+    # last slot everything above the largest bound
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {**{str(b): n for b, n in zip(self.bounds, self.counts)}, "+Inf": self.counts[-1]},
+        }
+
+
+class CallbackStats:
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.errors = 0
+        self.prevented = 0
+        self.wall_ms = Histogram(TIME_BUCKETS_MS)
+        self.data_ms = Histogram(TIME_BUCKETS_MS)
+        self.build_ms = Histogram(TIME_BUCKETS_MS)
+        self.payload_bytes = Histogram(PAYLOAD_BUCKETS)
+
+    def to_dict(self):
+        return {
+            "outputs": self.outputs,
+            "errors": self.errors,
+            "prevented": self.prevented,
+            "wall_ms": self.wall_ms.to_dict(),
+            "data_ms": self.data_ms.to_dict(),
+            "build_ms": self.build_ms.to_dict(),
+            "payload_bytes": self.payload_bytes.to_dict(),
+        }
+
+
+class CallbackTimings:
+    # Per-callback wall time, split into data access (functions marked with
+    # data_access) and everything else ("build": figure/table construction),
+    # plus the size of the JSON response Dash sent back
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def data_access(self, func):
+        # Time spent in func counts as data access for the running callback;
+        # nested data-access calls are only counted once
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            span = getattr(self.local, "span", None)
+            if span is None or span["depth"]:
+                return func(*args, **kwargs)
+            span["depth"] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                span["data"] += time.perf_counter() - start
+                span["depth"] -= 1
+        return wrapper
+
+    def wrap(self, name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            span = self.local.span = {"data": 0.0, "depth": 0}
+            outcome = None
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except PreventUpdate:
+                outcome = "prevented"
+                raise
+            except Exception:
+                outcome = "errors"
+                raise
+            finally:
+                wall = (time.perf_counter() - start) * 1000
+                data = span["data"] * 1000
+                self.local.span = None
+                with self.lock:
+                    stats = self.stats[name]
+                    if outcome:
+                        setattr(stats, outcome, getattr(stats, outcome) + 1)
+                    stats.wall_ms.observe(wall)
+                    stats.data_ms.observe(data)
+                    stats.build_ms.observe(wall - data)
+                if has_request_context():
+                    g.callback_timing = name
+        return wrapper
+
+    def instrument(self, *callback_maps):
+        # Wrap every registered callback, keyed by function name (plus the
+        # output when two callbacks share a name)
+        for callback_map in callback_maps:
+            for output, entry in callback_map.items():
+                func = entry.get("callback")
+                if func is None or getattr(func, "_timed", False):
+                    continue
+                name = func.__name__
+                if name in self.stats:
+                    name = f"{name}[{output}]"
+                self.stats[name] = CallbackStats(output)
+                entry["callback"] = self.wrap(name, func)
+                entry["callback"]._timed = True
+
+    def record_response(self, response):
+        name = g.pop("callback_timing", None)
+        if name is not None:
+            with self.lock:
+                self.stats[name].payload_bytes.observe(len(response.get_data()))
+        return response
+
+    def snapshot(self):
+        with self.lock:
+            return {name: stats.to_dict() for name, stats in sorted(self.stats.items())}
+
+    def attach(self, server, path="/callback-timings"):
+        server.after_request(self.record_response)
+        server.add_url_rule(path, "callback_timings", lambda: jsonify(self.snapshot()))
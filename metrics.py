@@ -0,0 +1,157 @@
+import glob
+import json
+import os
+import threading
+import time
+
+# Prometheus text exposition, built from an in-process registry of collector
+# functions. With a shared directory every worker also dumps its samples there
+# (throttled, atomically), and /metrics on any worker merges all of them:
+# counters and histograms are summed over workers, gauges are reported per
+# live worker with a pid label.
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    # A collector returns a list of metric families:
+    #   {"name", "type": counter|gauge|histogram, "help", "samples": [(suffix, labels, value)]}
+    # where suffix is "" or "_bucket"/"_sum"/"_count" for histograms
+
+    def __init__(self, directory=None, interval=5.0):
+        self.collectors = []
+        self.directory = directory
+        self.interval = interval
+        self.last_dump = 0.0
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # Files left by workers of a previous run
+            for path in glob.glob(os.path.join(directory, "*.json")):
+                if not pid_alive(int(os.path.basename(path)[:-5])):
+                    os.remove(path)
+
+    def register(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def collect(self):
+        families = []
+        for collector in self.collectors:
+            families.extend(collector())
+        return families
+
+    def dump(self, force=False):
+        # Write this worker's samples to the shared directory, at most once per interval
+        if not self.directory:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_dump < self.interval:
+                return
+            self.last_dump = now
+        pid = os.getpid()
+        path = os.path.join(self.directory, f"{pid}.json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.collect(), f)
+        os.replace(tmp, path)
+
+    def merged(self):
+        # Families from every worker's file (this worker's freshly dumped)
+        self.dump(force=True)
+        merged = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            pid = int(os.path.basename(path)[:-5])
+            alive = pid_alive(pid)
+            try:
+                with open(path) as f:
+                    families = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for family in families:
+                if family["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(family["name"], {**family, "samples": {}})
+                for suffix, labels, value in family["samples"]:
+                    if family["type"] == "gauge":
+                        labels = {**labels, "pid": str(pid)}
+                    key = (suffix, tuple(labels.items()))
+                    target["samples"][key] = target["samples"].get(key, 0) + value
+        return [
+            {**family, "samples": [(suffix, dict(labels), value) for (suffix, labels), value in family["samples"].items()]}
+            for family in merged.values()
+        ]
+
+    def render(self):
+        families = self.merged() if self.directory else self.collect()
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family['name']} {family['help']}")
+            lines.append(f"# TYPE {family['name']} {family['type']}")
+            for suffix, labels, value in family["samples"]:
+                lines.append(f"{family['name']}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def attach(self, server, path="/metrics"):
+        def metrics():
+            return self.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+        def after_request(response):
+            self.dump()
+            return response
+
+        server.add_url_rule(path, "metrics", metrics)
+        if self.directory:
+            server.after_request(after_request)
+
+
+def family(name, kind, help_text, samples):
+    return {"name": name, "type": kind, "help": help_text, "samples": samples}
+
+
+def histogram_samples(histogram, labels, scale=1.0):
+    # Cumulative le-buckets from an instrumentation.Histogram, bounds and
+    # values multiplied by scale (e.g. 1e-3 for ms -> seconds)
+    samples, cumulative = [], 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        samples.append(("_bucket", {**labels, "le": format_value(bound * scale)}, cumulative))
+    samples.append(("_bucket", {**labels, "le": "+Inf"}, histogram.count))
+    samples.append(("_sum", labels, histogram.sum * scale))
+    samples.append(("_count", labels, histogram.count))
+    return samples
+
+
+def resident_memory_bytes():
+    # Current RSS from /proc where available, else the peak from getrusage
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
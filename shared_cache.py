@@ -0,0 +1,155 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from figure_cache import cache_key
+
+
+class DiskCache:
+    # SQLite-backed result cache shared by every worker on the host.
+    # Rows carry the dataset version they were built from, an expiry time and
+    # their pickled size; other versions are purged on open and ignored on read,
+    # and the least recently used rows are dropped once max_bytes is exceeded.
+    # The total size is kept in a one-row table by triggers, so checking it on
+    # a write doesn't scan the cache. With no path the cache is disabled and
+    # memoize() is a no-op.
+
+    def __init__(self, path, max_bytes, ttl, version=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = version
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            db = self.connect()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, name TEXT, version TEXT, "
+                "expires REAL, accessed REAL, bytes INTEGER, value BLOB)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            # Every worker opens the cache at startup; the size table is
+            # created and seeded (from a cache written before it existed) once
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("CREATE TABLE IF NOT EXISTS size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO size SELECT 0, COALESCE(SUM(bytes), 0) FROM entries")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries "
+                       "BEGIN UPDATE size SET bytes = bytes + NEW.bytes; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries "
+                       "BEGIN UPDATE size SET bytes = bytes - OLD.bytes; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_resized AFTER UPDATE OF bytes ON entries "
+                       "BEGIN UPDATE size SET bytes = bytes + NEW.bytes - OLD.bytes; END")
+            db.execute("COMMIT")
+            self.purge()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def connect(self):
+        # One connection per thread and process; connections must not cross a
+        # fork, and gunicorn --preload forks after this module is imported
+        db = getattr(self.local, "db", None)
+        if db is None or self.local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    def purge(self):
+        # Drop rows from other dataset versions and expired rows
+        db = self.connect()
+        db.execute("DELETE FROM entries WHERE version IS NOT ? OR expires < ?", (self.version, time.time()))
+
+    def get(self, key):
+        db = self.connect()
+        now = time.time()
+        row = db.execute(
+            "SELECT value FROM entries WHERE key = ? AND version IS ? AND expires >= ?",
+            (key, self.version, now),
+        ).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def put(self, key, name, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        db = self.connect()
+        now = time.time()
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete
+        # wouldn't fire the size trigger
+        db.execute(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "name = excluded.name, version = excluded.version, expires = excluded.expires, "
+            "accessed = excluded.accessed, bytes = excluded.bytes, value = excluded.value",
+            (key, name, self.version, now + self.ttl, now, len(blob), blob),
+        )
+        total = db.execute("SELECT bytes FROM size").fetchone()[0]
+        if total > self.max_bytes:
+            self.evict(total - self.max_bytes)
+
+    def evict(self, excess):
+        # Least recently used first, until `excess` bytes are freed
+        db = self.connect()
+        freed, keys = 0, []
+        for key, size in db.execute("SELECT key, bytes FROM entries ORDER BY accessed"):
+            if freed >= excess:
+                break
+            keys.append((key,))
+            freed += size
+        db.executemany("DELETE FROM entries WHERE key = ?", keys)
+
+    def clear(self):
+        if self.enabled:
+            self.connect().execute("DELETE FROM entries")
+
+    def memoize(self, name):
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = cache_key(name, (args, kwargs))
+                value = self.get(key)
+                if value is None:
+                    value = func(*args, **kwargs)
+                    self.put(key, name, value)
+                return value
+            return wrapper
+        return decorator
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        entries, size = self.connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries WHERE version IS ?", (self.version,)
+        ).fetchone()
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "enabled": True,
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
@@ -0,0 +1,68 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM  # km
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    return R * c
+
+
+def unit_vectors(lat, lon):
+    # Points on the unit sphere; straight-line (chord) distance between them
+    # grows monotonically with great-circle distance, so a KD-tree over these
+    # returns the same neighbours as haversine
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class LocationIndex:
+    # KD-tree over location coordinates for k-nearest and radius queries.
+    # Filters are passed as a predicate taking the candidate rows and returning
+    # a boolean mask, so they are only evaluated on the candidates examined.
+
+    def __init__(self, locations):
+        coords = locations[["Latitude", "Longitude"]].to_numpy(dtype=float)
+        valid = np.isfinite(coords).all(axis=1)
+        self.locations = locations[valid].reset_index(drop=True)
+        self.tree = cKDTree(unit_vectors(coords[valid, 0], coords[valid, 1]))
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _rows(self, lat, lon, positions, predicate):
+        # Candidate rows that pass the predicate, with exact distances, nearest first
+        # (ties kept in catalogue order, like DataFrame.nsmallest)
+        rows = self.locations.iloc[np.sort(positions)]
+        if predicate is not None and len(rows):
+            rows = rows[np.asarray(predicate(rows), dtype=bool)]
+        rows = rows.assign(Distance_km=haversine(lat, lon, rows["Latitude"], rows["Longitude"]))
+        return rows.sort_values("Distance_km", kind="stable")
+
+    def nearest(self, lat, lon, k=5, predicate=None):
+        # Widen the search until k rows pass the predicate or every location is covered
+        n = len(self)
+        if n == 0:
+            return self._rows(lat, lon, np.array([], dtype=int), None)
+        point = unit_vectors(lat, lon)[0]
+        want = min(n, max(k * 4, 16))
+        while True:
+            _, positions = self.tree.query(point, k=want)
+            positions = np.atleast_1d(positions)
+            positions = positions[positions < n]
+            rows = self._rows(lat, lon, positions, predicate)
+            if len(rows) >= k or want >= n:
+                return rows.head(k)
+            want = min(n, want * 4)
+
+    def within(self, lat, lon, radius_km, predicate=None):
+        # Every location within radius_km (great-circle), nearest first
+        chord = 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+        positions = self.tree.query_ball_point(unit_vectors(lat, lon)[0], chord)
+        return self._rows(lat, lon, np.asarray(positions, dtype=int), predicate)
@@ -0,0 +1,176 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dataset import cols
+
+# Synthetic sample tables with the same schema as mappable.parquet, for
+# capacity testing at sizes the real South West extract can't show.
+#
+#   python synthetic.py national.parquet --locations 20000 --samples-per-year 20
+#
+# Rows are generated and written a block of locations at a time, so tens of
+# millions of rows never need to be in memory at once.
+
+# Metric columns in source-file order: (median, spread, share missing).
+# Spread is the log-normal sigma, or the normal sd for metrics marked linear.
+METRICS = {
+    'Ammoniacal Nitrogen as N (mg/l)': (0.58, 1.6, 0.35),
+    'Temperature of Water (°C)': (13.0, 3.5, 0.39),
+    'Orthophosphate, reactive as P (mg/l)': (1.9, 1.2, 0.75),
+    'Phosphorus, Total as P (mg/l)': (0.67, 0.9, 0.88),
+    'Nitrogen, Total Oxidised as N (mg/l)': (6.6, 1.0, 0.86),
+    'Nitrate as N (mg/l)': (5.0, 0.8, 0.95),
+    'Nitrite as N (mg/l)': (0.1, 1.3, 0.86),
+    'Nitrogen, Total as N (mg/l)': (7.2, 0.7, 0.93),
+    'Alkalinity to pH 4.5 as CaCO3 (mg/l)': (5.0, 0.9, 0.98),
+    'pH (phunits)': (7.2, 0.4, 0.73),
+    'Oxygen, Dissolved, % Saturation (%)': (99.0, 8.0, 0.99),
+    'Oxygen, Dissolved as O2 (mg/l)': (11.0, 2.0, 0.99),
+    'BOD : 5 Day ATU (mg/l)': (6.0, 0.7, 0.09),
+    'Solids, Suspended at 105 C (mg/l)': (9.0, 0.8, 0.34),
+    'Carbon, Organic, Dissolved as C :- {DOC} (mg/l)': (4.0, 0.6, 0.99),
+}
+LINEAR_METRICS = {'Temperature of Water (°C)', 'pH (phunits)', 'Oxygen, Dissolved, % Saturation (%)',
+                  'Oxygen, Dissolved as O2 (mg/l)'}
+
+# Test types with their share of sites, most common first
+TEST_TYPES = {
+    "FINAL SEWAGE EFFLUENT": 0.70,
+    "ANY SEWAGE": 0.18,
+    "RIVER / RUNNING SURFACE WATER": 0.05,
+    "ANY TRADE EFFLUENT": 0.03,
+    "ANY WATER": 0.03,
+    "UNCODED": 0.01,
+}
+REGIONS = ["Wales", "South West", "Thames", "Southern", "Anglian", "Midlands", "North West", "North East"]
+# Bounding box sites are scattered over (Great Britain, roughly)
+LONGITUDE = (-5.5, 1.5)
+LATITUDE = (50.1, 55.5)
+# Shape-cluster labels as the clustering step writes them
+SHAPES = [f"{float(i)}" for i in range(7)]
+# Share of samples that are spikes (x10, or +6 sd when linear), flagged as anomalies
+SPIKE_RATE = 0.003
+
+
+def generate_locations(rng, start, count):
+    # One row per site: ids, names, region, coordinates and test type
+    ids = np.arange(start, start + count)
+    lon = rng.uniform(*LONGITUDE, count)
+    lat = rng.uniform(*LATITUDE, count)
+    return pd.DataFrame({
+        "Location_ID": [f"X{i:07d}" for i in ids],
+        "Location_Name": [f"SYNTHETIC SITE {i}" for i in ids],
+        "Region": [REGIONS[int((x - LONGITUDE[0]) / (LONGITUDE[1] - LONGITUDE[0]) * len(REGIONS)) % len(REGIONS)]
+                   for x in lon],
+        # British National Grid, linearised around the centre of the box
+        "Easting": (400000 + (lon + 2.0) * 69000).astype(np.int64),
+        "Northing": (100000 + (lat - 50.0) * 111000).astype(np.int64),
+        "Longitude": lon,
+        "Latitude": lat,
+        "Test_Type": rng.choice(list(TEST_TYPES), count, p=list(TEST_TYPES.values())),
+    })
+
+
+def generate_block(rng, locations, years, samples_per_year):
+    # Samples for a block of sites; returns the rows in source-file column order
+    per_year = rng.poisson(samples_per_year, (len(locations), len(years)))
+    counts = per_year.sum(axis=1)
+    n = int(counts.sum())
+    site = np.repeat(np.arange(len(locations)), counts)
+
+    # Random timestamps inside each sampled year, in date order per site
+    year = np.repeat(np.tile(years, len(locations)), per_year.ravel())
+    year_start = pd.to_datetime(pd.Series(year).astype(str) + "-01-01").to_numpy()
+    offset = rng.uniform(0, 365 * 86400, n).astype("timedelta64[s]")
+    dates = year_start + offset
+    order = np.lexsort((dates, site))
+    site, dates = site[order], dates[order]
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype("timedelta64[D]").astype(float)
+    season = np.cos(2 * np.pi * (day_of_year - 200) / 365)
+
+    frame = locations.iloc[site].reset_index(drop=True)
+    frame.insert(7, "Date", pd.to_datetime(dates).as_unit("ns"))
+    frame.insert(8, "Month", frame["Date"].dt.month.astype(np.int64))
+    frame.insert(9, "Year", frame["Date"].dt.year.astype(np.int64))
+    # Rarely a site's name changes in the middle of its history
+    renamed = (rng.random(len(locations)) < 0.1)[site] & (rng.random(n) < 0.5)
+    frame["Location_Name"] = frame["Location_Name"].where(~renamed, frame["Location_Name"] + " FE")
+
+    flags, shapes = {}, {}
+    for col, (median, spread, missing) in METRICS.items():
+        # Per-site level, a seasonal swing and noise
+        level = rng.normal(0, spread / 2, len(locations))[site]
+        noise = rng.normal(0, spread / 2, n)
+        if col in LINEAR_METRICS:
+            swing = season * spread if col == 'Temperature of Water (°C)' else 0
+            values = median + level + swing + noise
+        else:
+            values = median * np.exp(level + noise)
+        spikes = rng.random(n) < SPIKE_RATE
+        values = np.where(spikes, values + 6 * spread if col in LINEAR_METRICS else values * 10, values)
+        # Whole sites and individual samples without a measurement
+        absent = (rng.random(len(locations)) < missing)[site] | (rng.random(n) < missing / 2)
+        values = np.where(absent, np.nan, np.round(values, 3))
+        frame[col] = values
+        if col in cols:
+            flags[f"{col}_flagged"] = spikes & ~absent
+            measured = pd.Series(~absent).groupby(site).any().reindex(range(len(locations)), fill_value=False)
+            for kind in ("yearly", "over-time"):
+                labels = np.where(measured, rng.choice(SHAPES, len(locations)), "Unidentified")
+                shapes[f"{col}_shape_{kind}"] = labels[site]
+
+    frame = pd.concat([frame, pd.DataFrame(flags), pd.DataFrame(shapes)], axis=1)
+    frame["Sample_Count"] = counts[site].astype(np.int64)
+    return frame
+
+
+def column_order():
+    # Same column order as mappable.parquet
+    return (["Location_ID", "Location_Name", "Region", "Easting", "Northing", "Longitude", "Latitude",
+             "Date", "Month", "Year", "Test_Type"] + list(METRICS)
+            + [f"{col}_flagged" for col in cols] + [f"{col}_shape_yearly" for col in cols]
+            + [f"{col}_shape_over-time" for col in cols] + ["Sample_Count"])
+
+
+def write_synthetic(path, locations=1000, start_year=2000, end_year=2025, samples_per_year=12,
+                    block=500, seed=0):
+    # Stream blocks of sites into one parquet file; returns the number of rows
+    rng = np.random.default_rng(seed)
+    years = np.arange(start_year, end_year + 1)
+    order = column_order()
+    writer, rows = None, 0
+    try:
+        for start in range(0, locations, block):
+            sites = generate_locations(rng, start, min(block, locations - start))
+            table = pa.Table.from_pandas(generate_block(rng, sites, years, samples_per_year)[order],
+                                         preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic sample table with the mappable.parquet schema")
+    parser.add_argument("path")
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--start-year", type=int, default=2000)
+    parser.add_argument("--end-year", type=int, default=2025)
+    parser.add_argument("--samples-per-year", type=float, default=12, help="mean samples per site per year")
+    parser.add_argument("--block", type=int, default=500, help="locations generated and written at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = write_synthetic(args.path, args.locations, args.start_year, args.end_year, args.samples_per_year,
+                           args.block, args.seed)
+    print(f"{rows} rows, {args.locations} locations -> {args.path} ({time.perf_counter() - started:.1f} s)")